@@ -0,0 +1,452 @@
+"""
+Несколько удавчиков на одном поле: боты, игроки за одним компьютером.
+
+Поле, еда, препятствия и ленты изменений - как у Engine (Arena - его наследник), вместо одного удавчика -
+список boas. Методы движка для одного удавчика (head, direction, turn_up..., snapshot и запись игры) у арены
+не работают и бросают исключение: сохранение, журнал и повтор арену не поддерживают. Одним удавчиком
+управляют через turn() или view(). За шаг двигаются все живые удавчики разом:
+
+    1. новые клетки голов (со сделанными поворотами), смерть об стену, дыру или скалу;
+    2. хвосты тех, кто не ест на этом шаге, уходят, так что в клетку уходящего хвоста идти можно;
+    3. голова в клетке чужого тела - STOP_BOA, своего - STOP_SELF_EAT. Несколько голов в одной клетке -
+       выживает самый длинный, если он такой один, остальные - STOP_HEAD;
+    4. тела погибших убираются с поля, живые сдвигаются.
+
+Чей удавчик в клетке - в массиве _owner, так что шаг стоит O(кол-ва удавчиков), а не суммарной длины тел.
+Длина тела на шаге сказывается только при гибели удавчика: его тело убирается с поля один раз.
+"""
+
+import time
+import array
+import collections
+
+from . import engine, headless, config, profiler
+
+_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class Boa(object):
+    """ Удавчик на общем поле. Тело - номера клеток (top * ширина + left) от головы к хвосту """
+
+    def __init__(self, index, width, body, direct):
+        self.index = index
+        self.body = collections.deque(body)
+        self.direct = direct
+        # заказанный поворот, применяется на следующем шаге
+        self.turn_to = None
+        # причина смерти из config.StopReasons, None - жив
+        self.reason = None
+        self._width = width
+
+    def alive(self):
+        return self.reason is None
+
+    def length(self):
+        return len(self.body)
+
+    def head(self):
+        """ координаты головы (top, left) """
+        return divmod(self.body[0], self._width)
+
+    def tail(self):
+        """ координаты хвоста (top, left) """
+        return divmod(self.body[-1], self._width)
+
+    def direction(self):
+        """ направление, в котором голова сдвинется на следующем шаге (top, left), с учетом заказанного поворота """
+        return self.turn_to or self.direct
+
+    def last_move(self):
+        """ направление последнего сделанного шага (top, left), разворот проверяется по нему """
+        return self.direct
+
+    def exception(self):
+        """ StopGameException с причиной смерти удавчика, None - жив """
+        return engine.StopGameException.from_reason(self.reason) if self.reason is not None else None
+
+
+class BoaView(object):
+    """
+    Один удавчик арены с интерфейсом одиночного движка (head, direction, cell, turn_up...), чтобы им могли
+    управлять стратегии из headless и автопилот
+    """
+
+    def __init__(self, arena, index):
+        self._arena = arena
+        self._boa = arena.boas[index]
+
+    def __getattr__(self, name):
+        # поле, еда, ленты изменений - общие
+        return getattr(self._arena, name)
+
+    def length(self):
+        return self._boa.length()
+
+    def head(self):
+        return self._boa.head()
+
+    def tail(self):
+        return self._boa.tail()
+
+    def direction(self):
+        return self._boa.direction()
+
+    def last_move(self):
+        return self._boa.last_move()
+
+    def turn_up(self):
+        self._arena.turn(self._boa.index, (-1, 0))
+
+    def turn_down(self):
+        self._arena.turn(self._boa.index, (1, 0))
+
+    def turn_left(self):
+        self._arena.turn(self._boa.index, (0, -1))
+
+    def turn_right(self):
+        self._arena.turn(self._boa.index, (0, 1))
+
+
+class Arena(engine.Engine):
+
+    def __init__(self, box_width, box_height, n_boas, boa_size=None, grid=None, seed=None, barrier_mech=None):
+        super(Arena, self).__init__(box_width, box_height, boa_size=boa_size, grid=grid, seed=seed,
+                                    barrier_mech=barrier_mech)
+
+        if n_boas < 1:
+            raise Exception(f'Задано слишком мало удавчиков: {n_boas}!')
+
+        self._n_boas = n_boas
+        self.boas = []
+        # живые удавчики, в порядке номеров
+        self._alive = []
+        # чей удавчик в клетке: номер удавчика + 1, 0 - ничей
+        self._owner = array.array('i')
+
+    def clear(self, seed=None):
+        with self.locked():
+            super(Arena, self).clear(seed)
+            self.boas = []
+            self._alive = []
+            self._owner = array.array('i', [0]) * (self._width * self._height)
+
+    def start(self):
+        with self.locked():
+            if self.boas:
+                return
+
+            self._to_rise = self.eats_interval
+
+            for i in range(self._n_boas):
+                self._place_boa(i)
+
+            self._alive = list(self.boas)
+
+            if self.difficulty and self._initial_boa_size * self._n_boas < (self._width * self._height) // 4:
+                self._create_barriers(self.difficulty['Barriers'])
+
+            self._add_eats()
+
+    def alive(self):
+        """ живые удавчики """
+        return list(self._alive)
+
+    def view(self, index):
+        """ удавчик index с интерфейсом одиночного движка (для стратегий и автопилота) """
+        return BoaView(self, index)
+
+    def turn(self, index, direct):
+        """ повернуть удавчика index в направлении (top, left). Разворот на 180 градусов не делается """
+        if direct not in _DIRECTIONS:
+            raise Exception(f'Задано неверное направление: {direct}!')
+
+        with self.locked():
+            boa = self.boas[index]
+
+            if boa.alive() and (boa.length() < 2 or direct != (-boa.last_move()[0], -boa.last_move()[1])):
+                boa.turn_to = direct
+
+    def move(self):
+        """
+        Шаг всех живых удавчиков
+
+        :return: list: удавчики, погибшие на этом шаге (причина - в boa.reason, исключение - boa.exception())
+        """
+
+        if not profiler.enabled:
+            return self._try_move()
+
+        with profiler.measure('arena.step'):
+            return self._try_move()
+
+    def _heads(self):
+        return [(boa.body[0], boa.direction()) for boa in self._alive]
+
+    # одиночного удавчика движка у арены нет: вместо пустого ответа или IndexError - понятная ошибка
+
+    @staticmethod
+    def _single_boa_only(name):
+        raise Exception(f'{name}: у арены несколько удавчиков, это есть только у одиночной игры! '
+                        f'Удавчик арены - boas[i] или view(i)')
+
+    def length(self):
+        self._single_boa_only('length')
+
+    def head(self):
+        self._single_boa_only('head')
+
+    def tail(self):
+        self._single_boa_only('tail')
+
+    def direction(self):
+        self._single_boa_only('direction')
+
+    def last_move(self):
+        self._single_boa_only('last_move')
+
+    def turn_right(self):
+        self._single_boa_only('turn_right')
+
+    def turn_left(self):
+        self._single_boa_only('turn_left')
+
+    def turn_up(self):
+        self._single_boa_only('turn_up')
+
+    def turn_down(self):
+        self._single_boa_only('turn_down')
+
+    def body_index(self, top, left):
+        self._single_boa_only('body_index')
+
+    def body_indexes(self):
+        self._single_boa_only('body_indexes')
+
+    def snapshot(self, pack=True):
+        self._single_boa_only('Сохранение')
+
+    @classmethod
+    def from_snapshot(cls, data, grid=None):
+        cls._single_boa_only('Загрузка')
+
+    def __getstate__(self):
+        self._single_boa_only('Сохранение')
+
+    def add_recorder(self, recorder):
+        self._single_boa_only('Запись игры')
+
+    def print_debug_info(self):
+        self._single_boa_only('print_debug_info')
+
+    def _place_boa(self, index, attempts=100):
+        """ поставить удавчика прямой линией в случайное свободное место, головой к свободной клетке """
+        w, h = self._width, self._height
+
+        for _ in range(attempts):
+            top, left = self._rand_coord(config.FIELD_GROUP_EATS)
+
+            if top is None:
+                break
+
+            direct = self._rnd.choice(_DIRECTIONS)
+            cells = [(top - direct[0] * i, left - direct[1] * i) for i in range(-1, self._initial_boa_size)]
+
+            if all(0 <= t < h and 0 <= l < w and self._rows[t][l] == config.FIELD_TYPE_NONE for t, l in cells):
+                boa = Boa(index, w, [t * w + l for t, l in cells[1:]], direct)
+                self.boas.append(boa)
+
+                for i, cell in enumerate(boa.body):
+                    self._owner[cell] = index + 1
+                    self._set_cell(cell // w, cell % w, config.FIELD_TYPE_HEAD if i == 0 else config.FIELD_TYPE_BODY)
+
+                return
+
+        raise Exception(f'Не хватает места на поле для удавчика номер {index + 1}!')
+
+    def _add_eats(self):
+        """ еды на поле - не меньше, чем живых удавчиков """
+        while self._stats[config.FIELD_GROUP_EATS] < len(self._alive) and self._stats[config.FIELD_GROUP_EMPTY]:
+            self._spawn_eat()
+
+    def _try_move(self):
+        with self.locked():
+            self._apply_commands()
+            w, h = self._width, self._height
+            dead = {}
+
+            if self._check_to_win():
+                for boa in self._alive:
+                    dead[boa] = config.STOP_WIN
+
+                return self._bury(dead)
+
+            # 1. куда идут головы
+            moves = []
+
+            for boa in self._alive:
+                if boa.turn_to:
+                    boa.direct, boa.turn_to = boa.turn_to, None
+
+                top, left = divmod(boa.body[0], w)
+                top, left = top + boa.direct[0], left + boa.direct[1]
+
+                if top < 0 or top >= h or left < 0 or left >= w:
+                    dead[boa] = config.STOP_WALL
+                    moves.append((boa, None, False))
+                    continue
+
+                cell_type = self._rows[top][left]
+
+                if cell_type == config.FIELD_TYPE_HOLE:
+                    dead[boa] = config.STOP_HOLE
+                elif cell_type == config.FIELD_TYPE_ROCK:
+                    dead[boa] = config.STOP_ROCK
+
+                moves.append((boa, top * w + left, cell_type in config.AreaTypes[config.FIELD_GROUP_EATS]))
+
+            # 2. хвосты уходят одновременно со сдвигом голов
+            for boa, target, grow in moves:
+                if not grow:
+                    self._free_cell(boa.body.pop())
+
+            # 3. столкновения
+            targets = collections.defaultdict(list)
+
+            for boa, target, grow in moves:
+                if boa not in dead:
+                    targets[target].append(boa)
+
+            for target, group in targets.items():
+                owner = self._owner[target]
+
+                if owner:
+                    for boa in group:
+                        dead[boa] = config.STOP_SELF_EAT if owner == boa.index + 1 else config.STOP_BOA
+                elif len(group) > 1:
+                    longest = max(boa.length() for boa in group)
+                    winners = [boa for boa in group if boa.length() == longest]
+
+                    for boa in group:
+                        if len(winners) > 1 or boa is not winners[0]:
+                            dead[boa] = config.STOP_HEAD
+
+            # 4. погибшие убираются, живые сдвигаются
+            died = self._bury(dead)
+
+            for boa, target, grow in moves:
+                if boa in dead:
+                    continue
+
+                if boa.body:
+                    self._set_cell(boa.body[0] // w, boa.body[0] % w, config.FIELD_TYPE_BODY)
+
+                boa.body.appendleft(target)
+                self._owner[target] = boa.index + 1
+                self._set_cell(target // w, target % w, config.FIELD_TYPE_HEAD)
+
+            # появление еды через каждые n шагов
+            self._to_rise -= 1
+
+            if self._to_rise <= 0:
+                self._to_rise = self.eats_interval
+                self._add_eats()
+
+            return died
+
+    def _free_cell(self, cell):
+        self._owner[cell] = 0
+        self._set_cell(cell // self._width, cell % self._width, config.FIELD_TYPE_NONE)
+
+    def _bury(self, dead):
+        """ убрать с поля погибших удавчиков dead: {удавчик: причина}. :return: list: они же, в порядке номеров """
+        if not dead:
+            return []
+
+        for boa, reason in dead.items():
+            boa.reason = reason
+
+            if reason == config.STOP_WIN:
+                continue
+
+            while boa.body:
+                self._free_cell(boa.body.pop())
+
+        self._alive = [boa for boa in self._alive if boa.reason is None]
+        return sorted(dead, key=lambda boa: boa.index)
+
+
+def benchmark(width, height, n_boas, length=None, grid=None, difficulty=config.DIFF_EASY, ticks=None, policy=None,
+              script=None, seed=None, spectators=None):
+    """
+    Гоняет арену без отрисовки с максимальной скоростью ticks шагов, каждым удавчиком управляет своя стратегия
+    policy (имя из headless.Policies). Когда погибают все удавчики, игра начинается заново. spectators - сервер
+    трансляции игры (spectator.SpectatorServer)
+
+    :return: dict: статистика прогона
+    """
+
+    ticks = ticks or 10000
+    policy = policy or headless.POLICY_RANDOM
+    latencies = array.array('d')
+    deaths = collections.Counter()
+    moves = 0
+    n_games = 0
+
+    started = time.perf_counter()
+    game = Arena(width, height, n_boas, boa_size=length, grid=grid, seed=seed)
+    game.difficulty = config.Difficultys[difficulty]
+
+    if spectators:
+        spectators.attach(game)
+
+    while len(latencies) < ticks:
+        game.clear()
+        game.start()
+        policies = [headless.make_policy(policy, script=script, seed=None if seed is None else seed + i)
+                    for i in range(n_boas)]
+        views = [game.view(i) for i in range(n_boas)]
+
+        while game.alive() and len(latencies) < ticks:
+            for boa in game.alive():
+                policies[boa.index].step(views[boa.index])
+
+            moves += len(game.alive())
+            t = time.perf_counter()
+            died = game.move()
+            latencies.append(time.perf_counter() - t)
+            deaths.update(boa.reason for boa in died)
+
+        n_games += not game.alive()
+
+    total = time.perf_counter() - started
+    step_time = sum(latencies)
+    latencies = sorted(latencies)
+
+    return {
+        'width': width,
+        'height': height,
+        'boas': n_boas,
+        'ticks': len(latencies),
+        'games': n_games,
+        'deaths': dict(deaths),
+        'total_time': total,
+        'ticks_per_sec': len(latencies) / step_time if step_time else 0.0,
+        'moves_per_sec': moves / step_time if step_time else 0.0,
+        'p50': headless.percentile(latencies, 50),
+        'p95': headless.percentile(latencies, 95),
+        'max': latencies[-1] if latencies else 0.0
+    }
+
+
+def print_report(stats):
+    print('-= Arena benchmark =-')
+    print(f'Board: {stats["width"]} x {stats["height"]}  Boas: {stats["boas"]}')
+    print(f'Ticks: {stats["ticks"]}  Games finished: {stats["games"]}')
+
+    for reason, n in sorted(stats['deaths'].items()):
+        print(f'    {config.StopReasons[reason][1]} {n}')
+
+    print(f'Total time: {round(stats["total_time"], 3)} s')
+    print(f'Ticks/sec: {round(stats["ticks_per_sec"])}  Boa moves/sec: {round(stats["moves_per_sec"])}')
+    print(f'Tick latency, us:  p50: {round(stats["p50"] * 1e6, 1)}  p95: {round(stats["p95"] * 1e6, 1)}  '
+          f'max: {round(stats["max"] * 1e6, 1)}')
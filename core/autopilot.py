@@ -0,0 +1,288 @@
+"""
+Автопилот: ведет удавчика к еде кратчайшим путем, а если к еде идти опасно - держится за своим хвостом.
+
+Путь к еде ищется A* (эвристика - манхэттенское расстояние до ближайшей еды), поиск ограничен
+config.AutopilotSearchLimit клетками, так что ход укладывается в шаг игры и на больших полях. Найденный
+путь запоминается и используется, пока он годен: тело идет точно по следам головы, так что путь может
+испортить только новое препятствие на нем, ввод игрока или появившаяся ближе еда. Это видно по ленте
+изменений поля (Engine.subscribe), так что заново путь ищется только тогда.
+
+Каждый ход проверяется на безопасность заливкой от клетки, куда идет голова: ход безопасен, если оттуда
+виден хвост или хватает места, чтобы развернуться (не меньше длины удавчика). Заливка останавливается,
+как только это выяснилось, поэтому ее цена - не больше длины удавчика, а не всё поле.
+"""
+
+import heapq
+import collections
+
+from . import headless, config
+
+
+class Autopilot(object):
+    """ Управление удавчиком, step() - перед каждым шагом игры. Интерфейс - как у стратегий из headless """
+
+    def __init__(self, search_limit=None):
+        self.search_limit = search_limit or config.AutopilotSearchLimit
+        self._game = None
+        self._feed = None
+        self._width = 0
+        self._height = 0
+        # запомненный путь: номера клеток от следующей до цели, и они же - множеством
+        self._plan = collections.deque()
+        self._plan_cells = set()
+        self._target = None
+        # где должна оказаться голова, если игрок не вмешивался
+        self._expected = None
+
+    def detach(self):
+        """ отписаться от движка (например, при выключении автопилота) """
+        if self._game is not None:
+            self._game.unsubscribe(self._feed)
+
+        self._game = None
+        self._feed = None
+        self._clear_plan()
+
+    def step(self, game):
+        if game is not self._game:
+            self.detach()
+            self._game = game
+            self._feed = game.subscribe()
+            self._height, self._width = game.size()
+
+        top, left = game.head()
+        head = top * self._width + left
+
+        if self._plan and self._plan[0] == head:
+            self._plan_cells.discard(self._plan.popleft())
+
+        if not self._plan_valid(game, head):
+            self._clear_plan()
+            self._search(game, head)
+
+        move = None
+
+        if self._plan:
+            if self._is_safe(game, head, self._plan[0]):
+                move = self._plan[0]
+            else:
+                self._clear_plan()
+
+        if move is None:
+            move = self._survive(game, head)
+
+        if move is None:
+            # деваться некуда
+            return
+
+        self._expected = move
+        direct = (move // self._width - top, move % self._width - left)
+
+        if direct != game.direction():
+            headless.turn(game, direct)
+
+    def _clear_plan(self):
+        self._plan.clear()
+        self._plan_cells.clear()
+        self._target = None
+        self._expected = None
+
+    def _plan_valid(self, game, head):
+        cells, _ = self._feed.pop()
+
+        if not self._plan or cells is None or (self._expected is not None and head != self._expected):
+            return False
+
+        if game.cell(self._target // self._width, self._target % self._width) not in \
+                config.AreaTypes[config.FIELD_GROUP_EATS]:
+            return False
+
+        top, left = divmod(head, self._width)
+
+        for t, l in cells:
+            cell_type = game.cell(t, l)
+
+            # на пути появилось препятствие
+            if cell_type in config.DeathTypes and t * self._width + l in self._plan_cells:
+                return False
+            # появилась еда ближе цели
+            if cell_type in config.AreaTypes[config.FIELD_GROUP_EATS] and \
+                    abs(t - top) + abs(l - left) < len(self._plan):
+                return False
+
+        return True
+
+    def _passable(self, game, cell, tail):
+        """ можно ли пройти через клетку (хвост к этому времени уйдет) """
+        if cell == tail:
+            return True
+
+        return game.cell(cell // self._width, cell % self._width) not in config.DeathTypes
+
+    def _back(self, game, head):
+        """
+        Клетка позади головы: разворот на 180 градусов движок не разрешает даже одной голове. Считается от
+        последнего сделанного шага, как и в движке, а не от заказанного поворота
+        """
+
+        top, left = game.last_move()
+        return head - top * self._width - left
+
+    def _neighbours(self, cell):
+        top, left = divmod(cell, self._width)
+
+        if top > 0:
+            yield cell - self._width
+        if top < self._height - 1:
+            yield cell + self._width
+        if left > 0:
+            yield cell - 1
+        if left < self._width - 1:
+            yield cell + 1
+
+    def _tail(self, game):
+        if game.length() < 2:
+            return None
+
+        top, left = game.tail()
+        return top * self._width + left
+
+    def _search(self, game, head):
+        """
+        A* от головы к ближайшей еде. Если за search_limit клеток еда не найдена - путь до самой близкой к цели
+        из просмотренных клеток, чтобы хоть приблизиться к ней
+        """
+
+        eats = game.eats()
+
+        if not eats:
+            return
+
+        # цель эвристики - ближайшая к голове еда, но годится любая, на которую наткнется поиск
+        w, h = self._width, self._height
+        top, left = divmod(head, w)
+        targets = set(eats)
+        et, el = min((divmod(cell, w) for cell in eats), key=lambda c: abs(c[0] - top) + abs(c[1] - left))
+
+        def estimate(t, l):
+            return abs(t - et) + abs(l - el)
+
+        tail = self._tail(game)
+        back = self._back(game, head)
+        parents = {head: None}
+        dist = {head: 0}
+        best, best_h = None, None
+        # при равной оценке сначала - более дальние от головы, так A* идет прямо к цели, а не вширь
+        queue = [(estimate(top, left), 0, head)]
+        found = None
+
+        while queue and len(parents) <= self.search_limit:
+            _, neg_g, cell = heapq.heappop(queue)
+            g = -neg_g
+
+            if g > dist[cell]:
+                continue
+            if cell in targets:
+                found = cell
+                break
+
+            t, l = divmod(cell, w)
+
+            for nt, nl in ((t - 1, l), (t + 1, l), (t, l - 1), (t, l + 1)):
+                if nt < 0 or nt >= h or nl < 0 or nl >= w:
+                    continue
+
+                nb = nt * w + nl
+
+                if nb in dist and dist[nb] <= g + 1 or nb == back and cell == head:
+                    continue
+                if nb != tail and game.cell(nt, nl) in config.DeathTypes:
+                    continue
+
+                dist[nb] = g + 1
+                parents[nb] = cell
+                est = estimate(nt, nl)
+
+                if best_h is None or est < best_h:
+                    best, best_h = nb, est
+
+                heapq.heappush(queue, (g + 1 + est, -(g + 1), nb))
+
+        end = found if found is not None else best
+
+        if end is None:
+            return
+
+        path = []
+
+        while end != head:
+            path.append(end)
+            end = parents[end]
+
+        path.reverse()
+        self._plan.extend(path)
+        self._plan_cells.update(path)
+
+        # недоделанный путь ведет к еде, но до нее не доходит. Хватит его до конца, а там - снова поиск
+        self._target = found if found is not None else et * w + el
+
+    def _flood(self, game, head, start, limit):
+        """
+        Заливка от клетки start (голова уже в ней, старая голова head стала телом), не больше limit клеток
+
+        :return: tuple: (виден ли хвост, сколько клеток набрано)
+        """
+
+        tail = self._tail(game)
+        seen = {head, start}
+        queue = collections.deque((start,))
+        n = 0
+
+        while queue and n < limit:
+            cell = queue.popleft()
+            n += 1
+
+            for nb in self._neighbours(cell):
+                if nb in seen:
+                    continue
+                if nb == tail:
+                    return True, n
+
+                seen.add(nb)
+
+                if self._passable(game, nb, None):
+                    queue.append(nb)
+
+        return False, n
+
+    def _is_safe(self, game, head, cell):
+        if cell == self._back(game, head) or not self._passable(game, cell, self._tail(game)):
+            return False
+
+        limit = game.length() + 1
+        tail_seen, space = self._flood(game, head, cell, limit)
+        return tail_seen or space >= limit
+
+    def _survive(self, game, head):
+        """ ход без еды: туда, откуда виден хвост (подальше от него, чтобы не запереться), иначе - где просторнее """
+        tail = self._tail(game)
+        back = self._back(game, head)
+        limit = game.length() + 1
+        best, best_key = None, None
+
+        for cell in self._neighbours(head):
+            if cell == back or not self._passable(game, cell, tail):
+                continue
+
+            tail_seen, space = self._flood(game, head, cell, limit)
+            far = 0
+
+            if tail_seen and tail is not None:
+                far = abs(cell // self._width - tail // self._width) + abs(cell % self._width - tail % self._width)
+
+            key = (tail_seen or space >= limit, tail_seen, space, far)
+
+            if best_key is None or key > best_key:
+                best, best_key = cell, key
+
+        return best
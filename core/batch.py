@@ -0,0 +1,343 @@
+import time
+import random
+
+import numpy
+
+from . import engine, headless, config
+
+# действия на шаг для каждой игры
+ACT_NONE = -1
+ACT_UP = 0
+ACT_DOWN = 1
+ACT_LEFT = 2
+ACT_RIGHT = 3
+
+# смещения (top, left) по номеру направления и противоположные направления
+_MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+_OFFSETS_TOP = numpy.array([m[0] for m in _MOVES], dtype=numpy.int64)
+_OFFSETS_LEFT = numpy.array([m[1] for m in _MOVES], dtype=numpy.int64)
+_OPPOSITE = numpy.array([ACT_DOWN, ACT_UP, ACT_RIGHT, ACT_LEFT], dtype=numpy.int8)
+
+STATUS_RUNNING = -1
+
+_EATS = numpy.array(config.AreaTypes[config.FIELD_GROUP_EATS], dtype=numpy.uint8)
+_BARRIERS = numpy.array(config.AreaTypes[config.FIELD_GROUP_BARRIER], dtype=numpy.uint8)
+
+
+class BatchEngine(object):
+    """
+    Пачка из K независимых игр, которые двигаются синхронно: один вызов step() - один шаг во всех играх сразу.
+    Состояние хранится столбцами (массивы numpy по всем играм): поля, кольцевые буферы тела, головы,
+    направления, точки поворота. Правила те же, что у Engine в режиме перемещения очередью: те же причины смерти
+    (config.StopReasons), рост на еде, появление еды раз в eats_interval шагов (по умолчанию
+    config.EatsRaiseInterval, как у Engine), уборка препятствий на четверти поля. Сверка с Engine - compare()
+    """
+
+    def __init__(self, n_games, box_width, box_height, boa_size=None, arrange_mech=None,
+                 difficulty=config.DIFF_EASY, seed=None, eats_interval=None):
+        self.eats_interval = config.EatsRaiseInterval if eats_interval is None else eats_interval
+        self._width = box_width
+        self._height = box_height
+        self._n = n_games
+        self._cells = box_width * box_height
+        self._initial_boa_size = boa_size
+        self._arrange_mech = arrange_mech
+        self.difficulty = config.Difficultys[difficulty]
+        self._rnd = numpy.random.default_rng(seed)
+        # начальная расстановка делается движком Engine, у каждого движка - свое начальное значение отсюда
+        self._seeds = random.Random(seed)
+
+        k, n = n_games, self._cells
+        self.grid = numpy.zeros((k, n), dtype=numpy.uint8)
+        # тело: кольцевой буфер номеров клеток, голова - в ring[head_pos], хвост - length - 1 позиций назад
+        self.ring = numpy.zeros((k, n), dtype=numpy.int32)
+        self.head_pos = numpy.zeros(k, dtype=numpy.int64)
+        self.length = numpy.zeros(k, dtype=numpy.int64)
+        # последнее направление движения головы и заказанные повороты (номер направления в клетке, -1 - нет)
+        self.last_move = numpy.zeros(k, dtype=numpy.int8)
+        self.turns = numpy.full((k, n), ACT_NONE, dtype=numpy.int8)
+        # кол-во пустых клеток и клеток с едой - для проверки на победу
+        self.free = numpy.zeros(k, dtype=numpy.int64)
+        self.to_rise = numpy.zeros(k, dtype=numpy.int64)
+        self.ticks = numpy.zeros(k, dtype=numpy.int64)
+        # результат игры (STATUS_RUNNING, config.WIN_CODE, config.LOSE_CODE) и причина из config.StopReasons
+        self.status = numpy.full(k, STATUS_RUNNING, dtype=numpy.int8)
+        self.reason = numpy.full(k, -1, dtype=numpy.int8)
+
+        self.reset()
+
+    def __len__(self):
+        return self._n
+
+    def reset(self, games=None):
+        """ начать заново игры с заданными номерами (по умолчанию - все) """
+        for k in range(self._n) if games is None else games:
+            self._load_game(k, self._new_engine())
+
+    def head(self):
+        """ номера клеток голов всех игр """
+        return self.ring[numpy.arange(self._n), self.head_pos]
+
+    def running(self):
+        return self.status == STATUS_RUNNING
+
+    def message(self, k):
+        """ сообщение об окончании k-й игры, как в StopGameException """
+        return config.StopReasons[int(self.reason[k])][1] if self.reason[k] >= 0 else ''
+
+    def step(self, actions=None):
+        """
+        Шаг во всех продолжающихся играх
+
+        :param actions: массив из K действий (ACT_NONE, ACT_UP, ACT_DOWN, ACT_LEFT, ACT_RIGHT), None - без поворотов
+        :return: numpy.ndarray: номера игр, закончившихся на этом шаге
+        """
+
+        games = numpy.flatnonzero(self.status == STATUS_RUNNING)
+
+        if not len(games):
+            return games
+
+        head = self.ring[games, self.head_pos[games]]
+
+        # повороты: как Engine._change_direction, разворот на 180 градусов игнорируется
+        if actions is not None:
+            act = numpy.asarray(actions, dtype=numpy.int8)[games]
+            ok = (act != ACT_NONE) & (act != _OPPOSITE[self.last_move[games]])
+            self.turns[games[ok], head[ok]] = act[ok]
+
+        # игра пошла серьезная - убираем препятствия
+        for k in games[self.length[games] == self._cells // 4].tolist():
+            barriers = numpy.isin(self.grid[k], _BARRIERS)
+            self.free[k] += int(barriers.sum())
+            self.grid[k][barriers] = config.FIELD_TYPE_NONE
+
+        ended = []
+
+        # победа - свободных клеток не осталось
+        win = self.free[games] == 0
+        self._finish(games[win], config.STOP_WIN)
+        ended.append(games[win])
+        games, head = games[~win], head[~win]
+
+        # направление: заказанный в клетке головы поворот, иначе - прежнее
+        turn = self.turns[games, head]
+        move = numpy.where(turn != ACT_NONE, turn, self.last_move[games])
+        self.turns[games, head] = ACT_NONE
+        self.last_move[games] = move
+
+        top = head // self._width + _OFFSETS_TOP[move]
+        left = head % self._width + _OFFSETS_LEFT[move]
+
+        wall = (top < 0) | (top >= self._height) | (left < 0) | (left >= self._width)
+        self._finish(games[wall], config.STOP_WALL)
+        ended.append(games[wall])
+        games, head, top, left = games[~wall], head[~wall], top[~wall], left[~wall]
+
+        new = (top * self._width + left).astype(numpy.int32)
+        target = self.grid[games, new]
+
+        for cell_type, reason in ((config.FIELD_TYPE_HOLE, config.STOP_HOLE),
+                                  (config.FIELD_TYPE_ROCK, config.STOP_ROCK)):
+            dead = target == cell_type
+            self._finish(games[dead], reason)
+            ended.append(games[dead])
+            games, head, new, target = games[~dead], head[~dead], new[~dead], target[~dead]
+
+        # на еде хвост остается на месте, иначе освобождаем его клетку
+        grow = numpy.isin(target, _EATS)
+        release = games[~grow]
+        tail = self.ring[release, (self.head_pos[release] - self.length[release] + 1) % self._cells]
+        self.grid[release, tail] = config.FIELD_TYPE_NONE
+        self.free[release] += 1
+
+        length = self.length[games] + grow
+        neck = length > 1
+        self.grid[games[neck], head[neck]] = config.FIELD_TYPE_BODY
+
+        # врезался в себя
+        dead = self.grid[games, new] == config.FIELD_TYPE_BODY
+        reverse = dead & (new == head)
+        self._finish(games[reverse], config.STOP_SELF_REVERSE)
+        self._finish(games[dead & ~reverse], config.STOP_SELF_EAT)
+        ended.append(games[dead])
+        games, new, length = games[~dead], new[~dead], length[~dead]
+
+        self.grid[games, new] = config.FIELD_TYPE_HEAD
+        self.head_pos[games] = (self.head_pos[games] + 1) % self._cells
+        self.ring[games, self.head_pos[games]] = new
+        self.length[games] = length
+        self.free[games] -= 1
+        self.ticks[games] += 1
+
+        # появление еды через каждые n шагов
+        self.to_rise[games] -= 1
+        rise = games[self.to_rise[games] <= 0]
+        self.to_rise[rise] = self.eats_interval
+        self._add_eats(rise)
+
+        return numpy.concatenate(ended)
+
+    def _finish(self, games, reason):
+        self.status[games] = config.StopReasons[reason][0]
+        self.reason[games] = reason
+
+    def _add_eats(self, games):
+        """ еда в случайную пустую клетку каждой из игр. Сначала несколько случайных попыток на всех разом """
+        for _ in range(4):
+            if not len(games):
+                return
+
+            cells = self._rnd.integers(0, self._cells, size=len(games))
+            hit = self.grid[games, cells] == config.FIELD_TYPE_NONE
+            self.grid[games[hit], cells[hit]] = self._rnd.choice(_EATS, size=int(hit.sum()))
+            games = games[~hit]
+
+        # на плотно занятых полях - выбор из списка пустых клеток
+        for k in games.tolist():
+            empty = numpy.flatnonzero(self.grid[k] == config.FIELD_TYPE_NONE)
+
+            if len(empty):
+                self.grid[k, self._rnd.choice(empty)] = self._rnd.choice(_EATS)
+
+    def _new_engine(self):
+        game = engine.Engine(self._width, self._height, boa_size=self._initial_boa_size,
+                             arrange_mech=self._arrange_mech, move_mech=config.MOVE_MECH_QUEUE,
+                             seed=self._seeds.getrandbits(64))
+        game.difficulty = self.difficulty
+        game.eats_interval = self.eats_interval
+        game.clear()
+        game.start()
+        return game
+
+    def _load_game(self, k, game):
+        """ перенести начальное состояние игры из Engine в k-ю строку массивов """
+        self.grid[k] = game.board().ravel()
+        self.turns[k] = ACT_NONE
+
+        for (top, left), move in game._direct_points.items():
+            self.turns[k, top * self._width + left] = _MOVES.index(tuple(move))
+
+        body = [top * self._width + left for top, left in game._boa]
+        self.length[k] = len(body)
+        self.head_pos[k] = len(body) - 1
+        self.ring[k, :len(body)] = body[::-1]
+        self.last_move[k] = _MOVES.index(tuple(game._boa_moves[0]))
+
+        stats = game.stats()
+        self.free[k] = stats[config.FIELD_GROUP_EMPTY] + stats[config.FIELD_GROUP_EATS]
+        self.to_rise[k] = game._to_rise
+        self.ticks[k] = 0
+        self.status[k] = STATUS_RUNNING
+        self.reason[k] = -1
+
+
+def compare(n_games, width, height, length=None, difficulty=config.DIFF_EASY, eats_interval=None, ticks=None,
+            policy=None, script=None, seed=None):
+    """
+    Сверка BatchEngine с Engine: n_games игр идут и пачкой, и каждая своим движком. Управляет движками стратегия
+    policy (имя из headless.Policies), пачка получает те же повороты. Еда у них ставится разными генераторами, поэтому после шага еда движка переносится
+    туда, где ее поставила пачка (появиться она должна на том же шаге). Дальше поля, длины и причины окончания
+    игр должны совпадать на каждом шаге
+
+    :return: dict: статистика прогона и номера игр, разошедшихся с Engine
+    """
+
+    ticks = ticks or 10000
+    policy = policy or headless.POLICY_RANDOM
+    batch = BatchEngine(n_games, width, height, boa_size=length, difficulty=difficulty, seed=seed,
+                        eats_interval=eats_interval)
+    games = []
+
+    for k in range(n_games):
+        games.append(batch._new_engine())
+        batch._load_game(k, games[-1])
+
+    policies = [headless.make_policy(policy, script=script, seed=None if seed is None else seed + k)
+                for k in range(n_games)]
+
+    eat_cells = numpy.zeros(256, dtype=bool)
+    eat_cells[_EATS] = True
+    reasons = [None] * n_games
+    mismatched = set()
+    batch_time = engine_time = 0.0
+    n_ticks = 0
+
+    while n_ticks < ticks and batch.running().any():
+        actions = [ACT_NONE] * n_games
+
+        for k, game in enumerate(games):
+            if reasons[k] is None and k not in mismatched:
+                direct = game.direction()
+                policies[k].step(game)
+
+                if game.direction() != direct:
+                    actions[k] = _MOVES.index(game.direction())
+
+        t = time.perf_counter()
+
+        for k, game in enumerate(games):
+            if reasons[k] is not None or k in mismatched:
+                continue
+
+            try:
+                game.move()
+            except engine.StopGameException as e:
+                reasons[k] = e.reason
+
+        engine_time += time.perf_counter() - t
+        t = time.perf_counter()
+        batch.step(actions)
+        batch_time += time.perf_counter() - t
+        n_ticks += 1
+
+        for k, game in enumerate(games):
+            if k in mismatched:
+                continue
+
+            if batch.running()[k] != (reasons[k] is None) or (reasons[k] is not None and reasons[k] != batch.reason[k]):
+                mismatched.add(k)
+                continue
+
+            if reasons[k] is not None:
+                continue
+
+            area = numpy.frombuffer(game.area_bytes(), dtype=numpy.uint8)
+            grid = batch.grid[k]
+            # еда, которую поставил только движок или только пачка, и еда другого вида в той же клетке
+            own = numpy.flatnonzero(eat_cells[area] & (grid == config.FIELD_TYPE_NONE))
+            other = numpy.flatnonzero(eat_cells[grid] & ((area == config.FIELD_TYPE_NONE) |
+                                                         (eat_cells[area] & (area != grid))))
+
+            if len(own) != numpy.count_nonzero(area[other] == config.FIELD_TYPE_NONE):
+                mismatched.add(k)
+                continue
+
+            for cell in own.tolist():
+                game._set_cell(cell // width, cell % width, config.FIELD_TYPE_NONE)
+            for cell in other.tolist():
+                game._set_cell(cell // width, cell % width, int(grid[cell]))
+
+            if game.length() != batch.length[k] or game.area_bytes() != grid.tobytes():
+                mismatched.add(k)
+
+    return {
+        'width': width,
+        'height': height,
+        'games': n_games,
+        'ticks': n_ticks,
+        'finished': sum(reason is not None for reason in reasons),
+        'mismatched': sorted(mismatched),
+        'engine_ticks_per_sec': n_ticks * n_games / engine_time if engine_time else 0.0,
+        'batch_ticks_per_sec': n_ticks * n_games / batch_time if batch_time else 0.0
+    }
+
+
+def print_report(stats):
+    print('-= Batch vs Engine =-')
+    print(f'Board: {stats["width"]} x {stats["height"]}  Games: {stats["games"]}')
+    print(f'Ticks: {stats["ticks"]}  Games finished: {stats["finished"]}')
+    print(f'Game ticks/sec: Engine: {round(stats["engine_ticks_per_sec"])}  '
+          f'BatchEngine: {round(stats["batch_ticks_per_sec"])}')
+    print(f'Mismatched games: {len(stats["mismatched"])}' +
+          (f'  numbers: {stats["mismatched"]}' if stats['mismatched'] else ''))
@@ -0,0 +1,67 @@
+import array
+import random
+
+
+class CellSet(object):
+    """
+    Множество номеров клеток поля (top * width + left).
+    Добавление, удаление и выбор случайной клетки - за O(1): клетки лежат в плотном массиве,
+    а удаляемая клетка замещается последней. Второй массив хранит позицию каждой клетки (-1 - нет в множестве)
+    """
+
+    def __init__(self, size, full=False):
+        if full:
+            self._items = array.array('i', range(size))
+            self._pos = array.array('i', range(size))
+        else:
+            self._items = array.array('i')
+            self._pos = array.array('i', [-1]) * size
+
+    @classmethod
+    def from_items(cls, size, items):
+        """ множество с заданным порядком элементов (например, из сохранения) """
+        res = cls(size)
+        res._items = array.array('i', items)
+
+        for i, cell in enumerate(res._items):
+            res._pos[cell] = i
+
+        return res
+
+    def items(self):
+        """ копия элементов в текущем порядке """
+        return array.array('i', self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, cell):
+        return self._pos[cell] >= 0
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def item(self, i):
+        return self._items[i]
+
+    def add(self, cell):
+        if self._pos[cell] < 0:
+            self._pos[cell] = len(self._items)
+            self._items.append(cell)
+
+    def discard(self, cell):
+        i = self._pos[cell]
+
+        if i < 0:
+            return
+
+        last = self._items.pop()
+
+        if last != cell:
+            self._items[i] = last
+            self._pos[last] = i
+
+        self._pos[cell] = -1
+
+    def choice(self, rnd=random):
+        return self._items[rnd.randrange(len(self._items))]
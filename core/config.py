@@ -5,13 +5,60 @@ AutosaveFile = 'autosave.dat'
 QuicksaveFile = 'quicksave.dat'
 NoAutosave = False
 
+# автосохранение журналом: как часто (мс) сбрасывать на диск лог ввода, и через сколько шагов заменять лог
+# новым полным снимком игры
+AutosaveInterval = 5000
+JournalSnapshotTicks = 2000
+
+# сохранения пишутся на диск в фоне, на выходе из игры их ждем не дольше стольких секунд
+SaveWaitTimeout = 5
+
+# автопилот: сколько клеток максимум просматривает поиск пути к еде за один ход
+AutopilotSearchLimit = 4000
+
+# замеры времени (profiler): по скольким последним замерам считать p50/p95/max; шаг игры опоздал, если
+# пришел позже, чем через столько интервалов между шагами
+ProfileWindow = 1000
+ProfileLateRatio = 1.5
+
+# препятствия не ставятся ближе стольких клеток перед головой (для BARRIER_MECH_LEVEL)
+BarrierHeadClearance = 3
+
+# трансляция игры зрителям (spectator): адрес, как часто (мс) рассылать изменения поля. Зритель, у которого
+# в буфере отправки больше SpectatorMaxBuffer байт, пропускает кадры, а через SpectatorDropTimeout секунд
+# отключается
+SpectatorHost = '127.0.0.1'
+SpectatorPort = 7531
+SpectatorInterval = 33
+SpectatorMaxBuffer = 1024 * 1024
+SpectatorDropTimeout = 10
+SpectatorMaxViewers = 1000
+
+# ключевые кадры записи повтора (для перемотки) - через столько шагов. Если кадров набралось больше
+# ReplayMaxKeyframes, каждый второй убирается, а шаг между кадрами удваивается
+ReplayKeyframeTicks = 500
+ReplayMaxKeyframes = 64
+
 MinSpeed = 50
+
+# игра рисуется не чаще раза в FrameInterval мс, шаги игры между кадрами идут по часам. Если не успеваем,
+# за кадр догоняется не больше MaxTicksPerFrame шагов. TurboRate - ускорение перемотки (клавиша t)
+FrameInterval = 16
+MaxTicksPerFrame = 50
+TurboRate = 8
 AccInterval = 2000 * 60
 Accelerator = 0.9
 
 BoxWidth = 20
 BoxHeight = 20
 
+# клетки мельче этого (в пикселях) не рисуются: если поле целиком в окно не влезает, показывается его часть
+# вокруг головы (камера), а все поле - на уменьшенной карте в углу (если Minimap)
+MinCellSize = 12
+Minimap = True
+MinimapSize = 150
+MinimapMargin = 4
+
 DIFF_VERY_EASY = 1
 DIFF_EASY = 2
 DIFF_NORMAL = 3
@@ -81,10 +128,27 @@ AreaTypes = {
 
 DeathTypes = AreaTypes[FIELD_GROUP_BOA] + AreaTypes[FIELD_GROUP_BARRIER]
 
+# обратное соответствие: тип фигуры -> группа
+AreaGroups = {cell_type: group for group, types in AreaTypes.items() for cell_type in types}
+
 ARRANGE_HELIX = 0
 ARRANGE_ZIGZAG = 1
 ArrangeTypes = (ARRANGE_HELIX, ARRANGE_ZIGZAG)
 
+MOVE_MECH_SEGMENTS = 0
+MOVE_MECH_QUEUE = 1
+MoveMechTypes = (MOVE_MECH_SEGMENTS, MOVE_MECH_QUEUE)
+
+GRID_LIST = 0
+GRID_NUMPY = 1
+GridTypes = (GRID_LIST, GRID_NUMPY)
+
+# расстановка препятствий: LINES - линии в случайных местах, как в старых версиях (нужна для старых сохранений
+# и записей), LEVEL - все линии разом и с проверкой, что поле не разрезано (levelgen)
+BARRIER_MECH_LINES = 0
+BARRIER_MECH_LEVEL = 1
+BarrierMechTypes = (BARRIER_MECH_LINES, BARRIER_MECH_LEVEL)
+
 Colors = {
     FIELD_TYPE_NONE: '#ece9d8',
     FIELD_TYPE_EATS1: '#ee7600',
@@ -100,9 +164,43 @@ Colors = {
 
 EatsRaiseInterval = 15
 
+# сколько секунд ждать освобождения движка, занятого другим потоком
+EngineLockTimeout = 5
+
+# максимальное кол-во заранее отрисованных клеток в кэше (в основном - цвета градиента тела)
+TileCacheSize = 4096
+
+# сохранять рассчитанные градиенты в профиль пользователя (на выходе из игры, palette.flush)
+PaletteDiskCache = True
+
+# сколько градиентов держать в памяти, давно не использованные вытесняются
+PaletteCacheSize = 8
+
 WIN_CODE = 0
 LOSE_CODE = 1
 
+# причины окончания игры
+STOP_WIN = 0
+STOP_WALL = 1
+STOP_SELF_REVERSE = 2
+STOP_SELF_EAT = 3
+STOP_HOLE = 4
+STOP_ROCK = 5
+# только когда удавчиков на поле несколько (arena)
+STOP_BOA = 6
+STOP_HEAD = 7
+
+StopReasons = {
+    STOP_WIN: (WIN_CODE, 'Ура! Победа!'),
+    STOP_WALL: (LOSE_CODE, 'Удавчик убился об стену!'),
+    STOP_SELF_REVERSE: (LOSE_CODE, 'Удавчик свернулся внутрь себя!'),
+    STOP_SELF_EAT: (LOSE_CODE, 'Удавчик съел сам себя!'),
+    STOP_HOLE: (LOSE_CODE, 'Удавчик провалился в дыру!'),
+    STOP_ROCK: (LOSE_CODE, 'Удавчик протаранил скалу!'),
+    STOP_BOA: (LOSE_CODE, 'Удавчик врезался в другого удавчика!'),
+    STOP_HEAD: (LOSE_CODE, 'Удавчики столкнулись лбами!')
+}
+
 SpWin_GradColor_1 = '#ff0000'
 SpWin_GradColor_2 = '#0000ff'
 SpLose_GradColor_1 = '#8b0000'
@@ -116,11 +214,19 @@ HELP_KEYS = ('F1:        Эта подсказка',
              's:         Начать новую игру',
              'e:         Закончить игру',
              'i:         Вывести в консоль служебную информацию',
+             'a:         Включить/выключить автопилот',
+             'm:         Показать/скрыть карту поля (если поле не влезает в окно)',
+             't:         Включить/выключить ускоренную перемотку',
              '1-5:       Задать сложность игры',
              'F5:        Быстрое сохранение',
              'F9:        Быстрая загрузка',
              'стрелки:   Изменить направление движения')
 
+HELP_REPLAY_KEYS = ('Просмотр записи игры\n',
+                    '<-, ->:    Перемотать назад/вперед',
+                    '+, -:      Быстрее/медленнее',
+                    's:         Закончить просмотр и начать новую игру')
+
 HELP_CHEAT_KEYS = ('b:         Накидать несколько препятствий',
                    'c:         Удалить все препятствия',
                    '+:         Увеличить скорость',
@@ -1,25 +1,86 @@
 import random
 import copy
+import array
+import itertools
+import threading
+import contextlib
+import collections
 
-from . import config
+from . import config, profiler, levelgen
+from .cellset import CellSet
+
+# numpy нужен только матрице поля на numpy и выгрузке поля, а грузится он долго - импортируется при первой
+# надобности (_import_numpy), чтобы не задерживать запуск игры
+numpy = None
+
+
+def _import_numpy():
+    """ :return: модуль numpy или None, если он не установлен """
+    global numpy
+
+    if numpy is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+
+        numpy = np
+
+    return numpy
 
 
 class StopGameException(Exception):
 
-    def __init__(self, code, *args):
+    def __init__(self, code, *args, reason=None):
         super(StopGameException, self).__init__(*args)
         self.code = code
+        self.reason = reason
+
+    @classmethod
+    def from_reason(cls, reason):
+        """ исключение по причине окончания игры из config.StopReasons """
+        code, message = config.StopReasons[reason]
+        return cls(code, message, reason=reason)
+
+
+class ChangeFeed(object):
+    """ Лента изменений поля для одного подписчика (например, окна отрисовки) """
+
+    def __init__(self):
+        self._cells = set()
+        self._full = True
+        self._body_shifted = False
+
+    def pop(self):
+        """
+        Забрать изменения, накопленные с прошлого вызова
+
+        :return: tuple: (set клеток (top, left), изменивших тип, или None - если изменилось все поле;
+            bool: удавчик сдвинулся, т.е. у всех элементов тела поменялись индексы)
+        """
+
+        cells = None if self._full else self._cells
+        res = (cells, self._body_shifted)
+        self._cells = set()
+        self._full = False
+        self._body_shifted = False
+        return res
 
 
 class Engine(object):
 
-    def __init__(self, box_width, box_height, boa_size=None, arrange_mech=None):
+    def __init__(self, box_width, box_height, boa_size=None, arrange_mech=None, move_mech=None, grid=None,
+                 seed=None, barrier_mech=None):
         self.difficulty = None
+        # через сколько шагов появляется еда. У повтора - как было при записи, глобальная настройка не трогается
+        self.eats_interval = config.EatsRaiseInterval
         self._width = box_width
         self._height = box_height
-        self._locked = False
         self._initial_boa_size = boa_size or 2
         self._arrange_mech = arrange_mech or config.ARRANGE_HELIX
+        self._move_mech = config.MOVE_MECH_QUEUE if move_mech is None else move_mech
+        self._grid = config.GRID_LIST if grid is None else grid
+        self._barrier_mech = config.BARRIER_MECH_LEVEL if barrier_mech is None else barrier_mech
 
         if self._initial_boa_size >= self._height * self._width:
             raise Exception(f'Задан стартовый размер удавчика ({self._initial_boa_size}), '
@@ -32,53 +93,260 @@ class Engine(object):
             raise Exception(f'Задан неверный тип расположения удавчика на поле: {self._arrange_mech}! '
                             'Возможные значения: 0 - 2')
 
+        if self._move_mech not in config.MoveMechTypes:
+            raise Exception(f'Задан неверный способ перемещения удавчика: {self._move_mech}! '
+                            'Возможные значения: 0 - 1')
+
+        if self._grid not in config.GridTypes:
+            raise Exception(f'Задан неверный тип матрицы поля: {self._grid}! Возможные значения: 0 - 1')
+
+        if self._barrier_mech not in config.BarrierMechTypes:
+            raise Exception(f'Задан неверный способ расстановки препятствий: {self._barrier_mech}! '
+                            'Возможные значения: 0 - 1')
+
+        if self._grid == config.GRID_NUMPY and _import_numpy() is None:
+            raise Exception('Для матрицы поля на numpy должен быть установлен пакет numpy!')
+
+        # свой генератор случайных чисел: вся игра определяется начальным значением и вводом игрока
+        self._rnd = random.Random(seed)
+
         # кол-во шагов до появления еды
         self._to_rise = 0
 
-        # матрица игрового поля, содержит тип фигуры в заданной точке
+        # матрица игрового поля, содержит тип фигуры в заданной точке. Список списков или numpy-массив uint8
         self._area = []
 
+        # строки поля для чтения и записи отдельных клеток: _rows[top][left] (_bind_area)
+        self._rows = self._area
+
+        # счетчики клеток поля по группам фигур (пусто, еда, удавчик, препятствия), меняются вместе с полем
+        self._stats = dict.fromkeys(config.AreaTypes, 0)
+
+        # индексы свободных клеток (пустых и с едой) для быстрого выбора случайной клетки
+        self._free = {config.FIELD_GROUP_EMPTY: CellSet(0), config.FIELD_GROUP_EATS: CellSet(0)}
+
+        # порядковый номер, присвоенный клетке поля, когда в нее вошла голова удавчика. Номер текущей головы - в
+        # _head_serial, так что индекс элемента удавчика в клетке = _head_serial - номер клетки
+        self._head_serial = 0
+        self._serials = array.array('q')
+
+        # подписчики на изменения поля, в сохранение не попадают
+        self._feeds = []
+
+        # получатели записей о действиях с игрой (поворотах, шагах, препятствиях): журнал автосохранения,
+        # запись повтора. Должны уметь: turn(direct), tick(), barriers(n_passes), remove_barriers().
+        # Вызываются под блокировкой движка, в сохранение не попадают
+        self._recorders = []
+
+        # блокировка состояния движка и очередь команд от других потоков, применяется на границе шага.
+        # Менять состояние может только тот, кто держит блокировку
+        self._lock = threading.RLock()
+        self._commands = collections.deque()
+
         # набор координат точек, при прохождении через которые, меняется направление движения, и собственно
         # флаги изменения направления
         self._direct_points = {}
 
-        # змейка, массив текущих координат на поле (top, left)
+        # змейка, массив текущих координат на поле (top, left). В режиме перемещения очередью - deque
         self._boa = []
 
         # змейка, массив смещений координат относительно соответсвующей точки массива реальных координат,
         # описывает направление движения элемента на поле (top, left)
         self._boa_moves = []
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+
+        for key in ('_feeds', '_recorders', '_lock', '_commands', '_rows'):
+            state.pop(key, None)
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.pop('_locked', None)
+        self._feeds = []
+        self._lock = threading.RLock()
+        self._commands = collections.deque()
+        self._recorders = []
+
+        if '_rnd' not in state:
+            self._rnd = random.Random()
+
+        if '_move_mech' not in state:
+            # сохранение старой версии: удавчик двигался поэлементно, переводим его на перемещение очередью
+            self._move_mech = config.MOVE_MECH_QUEUE
+
+            if self._boa:
+                self._to_queue()
+
+        if '_barrier_mech' not in state:
+            self._barrier_mech = config.BARRIER_MECH_LINES
+
+        if 'eats_interval' not in state:
+            self.eats_interval = config.EatsRaiseInterval
+
+        if '_grid' not in state:
+            self._grid = config.GRID_LIST
+        elif self._grid == config.GRID_NUMPY:
+            _import_numpy()
+
+        self._bind_area()
+
+        if '_free' not in state:
+            self._reindex()
+
+        if '_serials' not in state:
+            self._head_serial = 0
+            self._serials = array.array('q', [0]) * (self._width * self._height)
+            self._reflect_serials()
+
     def start(self):
-        if not self._boa:
-            self._to_rise = config.EatsRaiseInterval
+        with self.locked():
+            if not self._boa:
+                self._to_rise = self.eats_interval
+
+                if self._arrange_mech == config.ARRANGE_ZIGZAG:
+                    self._arrange_zigzag()
+                # elif self._arrange_mech == config.ARRANGE_HELIX:
+                #     self._arrange_helix()
+                else:
+                    self._arrange_helix()
 
-            if self._arrange_mech == config.ARRANGE_ZIGZAG:
-                self._arrange_zigzag()
-            # elif self._arrange_mech == config.ARRANGE_HELIX:
-            #     self._arrange_helix()
-            else:
-                self._arrange_helix()
+                if self._move_mech == config.MOVE_MECH_QUEUE:
+                    self._to_queue()
 
-            if len(self._boa) < (self._width * self._height) // 4:
-                self.create_barriers(self.difficulty['Barriers'])
+                if len(self._boa) < (self._width * self._height) // 4:
+                    self._create_barriers(self.difficulty['Barriers'])
 
-            self._add_eat()
+                self._add_eat()
 
-    def clear(self):
-        # self._initial_boa_size = 2
-        self._locked = False
-        self._boa = []
-        self._boa_moves = []
-        self._direct_points = {}
-        self._area = [[config.FIELD_TYPE_NONE for col in range(self._width)] for row in range(self._height)]
+    def clear(self, seed=None):
+        """ очистить поле перед новой игрой. seed - новое начальное значение генератора случайных чисел """
+        with self.locked():
+            if seed is not None:
+                self._rnd.seed(seed)
+
+            # self._initial_boa_size = 2
+            self._commands.clear()
+            self._boa = []
+            self._boa_moves = []
+            self._direct_points = {}
+            if self._grid == config.GRID_NUMPY:
+                self._area = numpy.full((self._height, self._width), config.FIELD_TYPE_NONE, dtype=numpy.uint8)
+            else:
+                self._area = [[config.FIELD_TYPE_NONE for col in range(self._width)] for row in range(self._height)]
+            self._bind_area()
+            self._stats = dict.fromkeys(config.AreaTypes, 0)
+            self._stats[config.FIELD_GROUP_EMPTY] = self._width * self._height
+            self._free = {
+                config.FIELD_GROUP_EMPTY: CellSet(self._width * self._height, full=True),
+                config.FIELD_GROUP_EATS: CellSet(self._width * self._height)
+            }
+            self._head_serial = 0
+            self._serials = array.array('q', [0]) * (self._width * self._height)
+
+            for feed in self._feeds:
+                feed._full = True
+
+    def subscribe(self):
+        """ Подписаться на изменения поля. Первый pop() у новой ленты всегда возвращает изменение всего поля """
+        feed = ChangeFeed()
+        self._feeds.append(feed)
+        return feed
+
+    def unsubscribe(self, feed):
+        if feed in self._feeds:
+            self._feeds.remove(feed)
+
+    def add_recorder(self, recorder):
+        with self.locked():
+            self._recorders.append(recorder)
+
+    def remove_recorder(self, recorder):
+        with self.locked():
+            if recorder in self._recorders:
+                self._recorders.remove(recorder)
+
+    def settings(self):
+        """ параметры, с которыми создан движок (аргументы конструктора, кроме seed) """
+        return {
+            'width': self._width,
+            'height': self._height,
+            'initial_boa_size': self._initial_boa_size,
+            'arrange_mech': self._arrange_mech,
+            'move_mech': self._move_mech,
+            'grid': self._grid,
+            'barrier_mech': self._barrier_mech
+        }
 
     def length(self):
         return len(self._boa)
 
+    def size(self):
+        """ размеры поля: (высота, ширина) """
+        return self._height, self._width
+
+    def head(self):
+        """ координаты головы (top, left) """
+        return self._boa[0][0], self._boa[0][1]
+
+    def tail(self):
+        """ координаты хвоста (top, left) """
+        return self._boa[-1][0], self._boa[-1][1]
+
+    def eats(self):
+        """ номера клеток с едой (top * ширина + left) """
+        return list(self._free[config.FIELD_GROUP_EATS])
+
+    def direction(self):
+        """ направление, в котором голова сдвинется на следующем шаге (top, left), с учетом заказанного поворота """
+        return tuple(self._direct_points.get(self.head(), self._boa_moves[0]))
+
+    def last_move(self):
+        """
+        Направление последнего сделанного шага (top, left). Поворот на 180 градусов проверяется по нему, а не по
+        заказанному повороту: после двух поворотов за шаг direction() может уже смотреть в другую сторону
+        """
+
+        return tuple(self._boa_moves[0])
+
+    @contextlib.contextmanager
+    def locked(self, timeout=None):
+        """
+        Монопольный доступ к состоянию движка (блокировка реентерабельная).
+        Если блокировку не удалось получить за timeout секунд (по умолчанию config.EngineLockTimeout) - TimeoutError
+        """
+
+        if not self._lock.acquire(timeout=config.EngineLockTimeout if timeout is None else timeout):
+            raise TimeoutError('Не удалось дождаться освобождения движка игры!')
+
+        try:
+            yield self
+        finally:
+            self._lock.release()
+
+    def post(self, command, *args):
+        """
+        Поставить команду в очередь, например: engine.post(engine.turn_left).
+        Очередь разбирается в начале следующего шага, так что вызывать можно из любого потока
+        """
+
+        self._commands.append((command, args))
+
+    def _apply_commands(self):
+        while self._commands:
+            command, args = self._commands.popleft()
+            command(*args)
+
     def move(self):
         """ переместиться на шаг вперед """
-        self._try_move()
+        if not profiler.enabled:
+            self._try_move()
+            return
+
+        with profiler.measure('engine.step'):
+            self._try_move()
 
     def turn_right(self):
         """ повернуть вправо """
@@ -99,69 +367,336 @@ class Engine(object):
     def create_barriers(self, n_passes=1):
         """ накидывает на поле несколько случайных препятствий """
 
-        while self._locked:
-            pass
+        with self.locked():
+            for recorder in self._recorders:
+                recorder.barriers(n_passes)
 
-        try:
-            self._locked = True
-
-            for _ in range(n_passes):
-                for __ in range(random.randint(0, self._width * self._height / 100)):
-                    top, left = self._rand_coord(config.FIELD_GROUP_BARRIER)
-
-                    if top is None or left is None:
-                        return
-
-                    of_top = random.choice((-1, 0, 1))
-                    of_left = random.choice((-1, 0, 1))
-                    el_type = random.choice(config.AreaTypes[config.FIELD_GROUP_BARRIER])
-
-                    for i in range(random.randint(1, 6)):
-                        if i == 0:
-                            self._area[top][left] = el_type
-                        else:
-                            t, l = top + of_top * i, left + of_left * i
-                            if self._check_pos(t, l):
-                                self._area[t][l] = el_type
-        finally:
-            self._locked = False
+            self._create_barriers(n_passes)
 
     def remove_barriers(self):
         """ убирает с поля все препятствия """
 
-        while self._locked:
-            pass
+        with self.locked():
+            for recorder in self._recorders:
+                recorder.remove_barriers()
 
-        try:
-            self._locked = True
-            for i in range(len(self._area)):
-                for j in range(len(self._area[i])):
-                    if self._area[i][j] in config.AreaTypes[config.FIELD_GROUP_BARRIER]:
-                        self._area[i][j] = config.FIELD_TYPE_NONE
-        finally:
-            self._locked = False
+            self._remove_barriers()
+
+    def _create_barriers(self, n_passes):
+        if self._barrier_mech == config.BARRIER_MECH_LINES:
+            self._create_barrier_lines(n_passes)
+            return
+
+        for cell, el_type in levelgen.generate(self._rnd, self.area_bytes(), self._width, self._height,
+                                               self._free[config.FIELD_GROUP_EMPTY], self._heads(), n_passes):
+            self._set_cell(cell // self._width, cell % self._width, el_type)
+
+    def _heads(self):
+        """ головы на поле: [(номер клетки, направление движения (top, left)), ...] """
+        if not self._boa:
+            return []
+
+        return [(self._boa[0][0] * self._width + self._boa[0][1], self.direction())]
+
+    def _create_barrier_lines(self, n_passes):
+        """ старая расстановка: линии по одной, в любом месте, без проверки связности поля """
+        for _ in range(n_passes):
+            for __ in range(self._rnd.randint(0, self._width * self._height // 100)):
+                top, left = self._rand_coord(config.FIELD_GROUP_BARRIER)
+
+                if top is None or left is None:
+                    return
+
+                of_top = self._rnd.choice((-1, 0, 1))
+                of_left = self._rnd.choice((-1, 0, 1))
+                el_type = self._rnd.choice(config.AreaTypes[config.FIELD_GROUP_BARRIER])
+
+                for i in range(self._rnd.randint(1, 6)):
+                    if i == 0:
+                        self._set_cell(top, left, el_type)
+                    else:
+                        t, l = top + of_top * i, left + of_left * i
+                        if self._check_pos(t, l):
+                            self._set_cell(t, l, el_type)
+
+    def _remove_barriers(self):
+        if self._grid == config.GRID_NUMPY:
+            # поиск - одной векторной операцией, через _set_cell идут только найденные клетки
+            barriers = numpy.isin(self._area, config.AreaTypes[config.FIELD_GROUP_BARRIER])
+
+            for cell in numpy.flatnonzero(barriers).tolist():
+                self._set_cell(cell // self._width, cell % self._width, config.FIELD_TYPE_NONE)
+
+            return
+
+        for i in range(len(self._area)):
+            for j in range(len(self._area[i])):
+                if self._area[i][j] in config.AreaTypes[config.FIELD_GROUP_BARRIER]:
+                    self._set_cell(i, j, config.FIELD_TYPE_NONE)
 
     def cell(self, top, left):
-        return self._area[top][left]
+        return self._rows[top][left]
+
+    def board(self):
+        """
+        Поле целиком: numpy-массив uint8 (высота x ширина) с типами фигур.
+        Для матрицы на numpy отдается без копирования, только для чтения
+        """
+
+        if _import_numpy() is None:
+            raise Exception('Для выгрузки поля должен быть установлен пакет numpy!')
+
+        if self._grid == config.GRID_NUMPY:
+            board = self._area.view()
+            board.flags.writeable = False
+            return board
+
+        return numpy.array(self._area, dtype=numpy.uint8)
+
+    def area_bytes(self):
+        """ поле целиком байтами по строкам (тип фигуры - байт), без numpy """
+        if self._grid == config.GRID_NUMPY:
+            return self._area.tobytes()
+
+        return b''.join(map(bytes, self._area))
+
+    def free_cells(self):
+        """ номера пустых клеток поля (top * ширина + left): list, по индексу пустых клеток """
+        return list(self._free[config.FIELD_GROUP_EMPTY])
+
+    def stats(self):
+        """ кол-во клеток поля по группам фигур: {группа: кол-во} """
+        return dict(self._stats)
 
     def body_index(self, top, left):
-        try:
-            return self._boa.index([top, left]) - 1
-        except Exception:
+        """ индекс элемента тела в клетке (голова - -1, первый элемент за головой - 0), за O(1) """
+        if self._rows[top][left] not in config.AreaTypes[config.FIELD_GROUP_BOA]:
             return 0
 
+        return self._head_serial - self._serials[top * self._width + left] - 1
+
+    def body_indexes(self):
+        """ индексы всех элементов удавчика разом: {(top, left): индекс}, нумерация как в body_index """
+        return {(coord[0], coord[1]): i - 1 for i, coord in enumerate(self._boa)}
+
+    def snapshot(self, pack=True):
+        """
+        Согласованный снимок состояния игры в виде простых данных (для сохранения и передачи в другой поток).
+        Клетки - номера top * ширина + left, смещения - пары (top, left), поле - байты по строкам.
+
+        pack=False - быстрый снимок, чтобы не держать игру: тело, смещения и точки поворота копируются как есть
+        (списком пар в 'boa', 'moves' и словарем в 'turns'), а в простые данные их переводит pack_snapshot() -
+        уже в том потоке, который будет снимок сохранять
+        """
+
+        with self.locked():
+            if self._move_mech == config.MOVE_MECH_QUEUE:
+                # в очереди элементы тела и смещений после добавления не меняются - хватит копии ссылок
+                boa, moves = list(self._boa), list(self._boa_moves)
+            else:
+                boa, moves = [tuple(cell) for cell in self._boa], [tuple(move) for move in self._boa_moves]
+
+            data = self.settings()
+            data.update({
+                'to_rise': self._to_rise,
+                'head_serial': self._head_serial,
+                'area': self.area_bytes(),
+                'boa': boa,
+                'moves': moves,
+                'turns': {cell: tuple(move) for cell, move in self._direct_points.items()},
+                # порядок элементов индексов свободных клеток определяет выбор случайной клетки, так что
+                # для воспроизводимости игры после загрузки он тоже сохраняется
+                'free_empty': self._free[config.FIELD_GROUP_EMPTY].items(),
+                'free_eats': self._free[config.FIELD_GROUP_EATS].items(),
+                'rng': self._rnd.getstate()
+            })
+
+        return self.pack_snapshot(data) if pack else data
+
+    @staticmethod
+    def pack_snapshot(data):
+        """ перевести быстрый снимок snapshot(pack=False) в простые данные, как у snapshot(). Готовый - как есть """
+        if 'turns' not in data:
+            return data
+
+        w = data['width']
+        data = dict(data)
+        turns = data.pop('turns')
+        data.update({
+            'boa': array.array('i', [top * w + left for top, left in data['boa']]),
+            'moves': array.array('b', list(itertools.chain.from_iterable(data['moves']))),
+            'turn_cells': array.array('i', [top * w + left for top, left in turns]),
+            'turn_moves': array.array('b', list(itertools.chain.from_iterable(turns.values())))
+        })
+        return data
+
+    @classmethod
+    def from_snapshot(cls, data, grid=None):
+        """
+        Движок из снимка snapshot(). grid - переопределить тип матрицы поля.
+        Снимок из файла может быть испорчен: если он не сходится сам с собой (размер поля, клетки за его
+        пределами, неизвестные фигуры) - ValueError
+        """
+
+        cls._check_snapshot(data)
+        game = cls(data['width'], data['height'], boa_size=data['initial_boa_size'],
+                   arrange_mech=data['arrange_mech'], move_mech=data['move_mech'],
+                   grid=data['grid'] if grid is None else grid,
+                   barrier_mech=data.get('barrier_mech', config.BARRIER_MECH_LINES))
+        game.clear()
+        w, h = game._width, game._height
+        area = data['area']
+
+        if game._grid == config.GRID_NUMPY:
+            game._area = numpy.frombuffer(area, dtype=numpy.uint8, count=w * h).reshape((h, w)).copy()
+        else:
+            game._area = [list(area[row * w:(row + 1) * w]) for row in range(h)]
+
+        game._bind_area()
+
+        moves = data['moves']
+        game._boa = [[cell // w, cell % w] for cell in data['boa']]
+        game._boa_moves = [[moves[i], moves[i + 1]] for i in range(0, len(moves), 2)]
+        turn_moves = data['turn_moves']
+        game._direct_points = {(cell // w, cell % w): [turn_moves[i * 2], turn_moves[i * 2 + 1]]
+                               for i, cell in enumerate(data['turn_cells'])}
+
+        if game._move_mech == config.MOVE_MECH_QUEUE:
+            game._boa = collections.deque(game._boa)
+            game._boa_moves = collections.deque(game._boa_moves)
+
+        game._to_rise = data['to_rise']
+        game._head_serial = data['head_serial']
+        game._reflect_serials()
+
+        if data.get('rng') is not None:
+            game._rnd.setstate(data['rng'])
+
+        if data.get('free_empty') is None:
+            game._reindex()
+            return game
+
+        area = bytes(area)
+        game._stats = dict.fromkeys(config.AreaTypes, 0)
+
+        for cell_type, group in config.AreaGroups.items():
+            game._stats[group] += area.count(cell_type.to_bytes(1, 'little'))
+
+        game._free = {
+            config.FIELD_GROUP_EMPTY: CellSet.from_items(w * h, data['free_empty']),
+            config.FIELD_GROUP_EATS: CellSet.from_items(w * h, data['free_eats'])
+        }
+        return game
+
+    @staticmethod
+    def _check_snapshot(data):
+        n = data['width'] * data['height']
+
+        if data['width'] < 1 or data['height'] < 1 or len(data['area']) != n:
+            raise ValueError(f'Размер поля ({len(data["area"])}) не совпадает с шириной и высотой '
+                             f'({data["width"]} x {data["height"]})!')
+
+        if bytes(data['area']).translate(None, bytes(config.AreaGroups)):
+            raise ValueError('На поле неизвестные фигуры!')
+
+        if len(data['moves']) != len(data['boa']) * 2 or len(data['turn_moves']) != len(data['turn_cells']) * 2:
+            raise ValueError('Кол-во смещений не совпадает с кол-вом клеток!')
+
+        for key in ('boa', 'turn_cells', 'free_empty', 'free_eats'):
+            cells = data.get(key)
+
+            if cells and (min(cells) < 0 or max(cells) >= n):
+                raise ValueError(f'Клетка за пределами поля ({key})!')
+
     def print_debug_info(self):
         print('-= Core =-')
         print(f'Dimensions:  Height: {self._height} Width: {self._width} Area: {self._width * self._height}')
         print(f'Start boa size: {self._initial_boa_size}')
         print(f'Current boa size: {len(self._boa)}')
+        print('Cells: ' + ' '.join(f'{group}: {n}' for group, n in self._stats.items()))
         print(f'Head position:  Top: {self._boa[0][0]} Left: {self._boa[0][1]}')
         print(f'Head direction:  Top: {self._boa_moves[0][0]} Left: {self._boa_moves[0][1]}')
         print(f'Arrange method: {self._arrange_mech}')
+        print(f'Move method: {self._move_mech}')
+        print(f'Barrier method: {self._barrier_mech}')
+        print(f'Grid: {"numpy" if self._grid == config.GRID_NUMPY else "list"}')
+
+    def _bind_area(self):
+        """
+        Строки поля для доступа к отдельным клеткам. У numpy-массива каждое обращение по индексу создает
+        объект-представление (сначала строки, потом элемента), это в разы медленнее списка. Поэтому для numpy
+        строки - memoryview поверх его памяти: то же обращение _rows[top][left] отдает и пишет обычный int,
+        а весь массив остается для векторных операций (board, _reindex, _remove_barriers)
+        """
+
+        if self._grid == config.GRID_NUMPY:
+            self._rows = [memoryview(row) for row in self._area]
+        else:
+            self._rows = self._area
+
+    def _set_cell(self, top, left, cell_type):
+        """ Записывает фигуру в клетку поля. Все изменения поля должны идти через этот метод """
+        old_type = self._rows[top][left]
+
+        if old_type == cell_type:
+            return
+
+        self._rows[top][left] = cell_type
+
+        for feed in self._feeds:
+            feed._cells.add((top, left))
+
+        old_group = config.AreaGroups[old_type]
+        new_group = config.AreaGroups[cell_type]
+
+        if old_group == new_group:
+            return
+
+        self._stats[old_group] -= 1
+        self._stats[new_group] += 1
+
+        if old_group in self._free:
+            self._free[old_group].discard(top * self._width + left)
+        if new_group in self._free:
+            self._free[new_group].add(top * self._width + left)
+
+    def _reindex(self):
+        """ Пересчитывает счетчики и индексы свободных клеток по всему полю """
+        self._stats = dict.fromkeys(config.AreaTypes, 0)
+        self._free = {
+            config.FIELD_GROUP_EMPTY: CellSet(self._width * self._height),
+            config.FIELD_GROUP_EATS: CellSet(self._width * self._height)
+        }
+
+        if self._grid == config.GRID_NUMPY:
+            flat = self._area.ravel()
+
+            for cell_type, n in enumerate(numpy.bincount(flat, minlength=len(config.AreaGroups)).tolist()):
+                self._stats[config.AreaGroups[cell_type]] += n
+
+            for group, cells in self._free.items():
+                for cell in numpy.flatnonzero(numpy.isin(flat, config.AreaTypes[group])).tolist():
+                    cells.add(cell)
+
+            return
+
+        for top, row in enumerate(self._area):
+            for left, cell_type in enumerate(row):
+                group = config.AreaGroups[cell_type]
+                self._stats[group] += 1
+
+                if group in self._free:
+                    self._free[group].add(top * self._width + left)
 
     def _reflect_boa_on_area(self):
         for i, coord in enumerate(self._boa):
-            self._area[coord[0]][coord[1]] = config.FIELD_TYPE_HEAD if i == 0 else config.FIELD_TYPE_BODY
+            self._set_cell(coord[0], coord[1], config.FIELD_TYPE_HEAD if i == 0 else config.FIELD_TYPE_BODY)
+
+        self._reflect_serials()
+
+    def _reflect_serials(self):
+        for i, coord in enumerate(self._boa):
+            self._serials[coord[0] * self._width + coord[1]] = self._head_serial - i
 
     def _helix_back(self, center_top, center_left):
         direct = 1  # 0 - слева-направо, 1 - снизу-вверх, 2 - справа-налево, 3 - сверху-вниз
@@ -326,110 +861,172 @@ class Engine(object):
         self._reflect_boa_on_area()
 
     def _add_eat(self):
+        if not profiler.enabled:
+            self._spawn_eat()
+            return
+
+        with profiler.measure('engine.spawn'):
+            self._spawn_eat()
+
+    def _spawn_eat(self):
         top, left = self._rand_coord(config.FIELD_GROUP_EATS)
 
         if top is None or left is None:
             return
 
-        self._area[top][left] = random.choice(config.AreaTypes[config.FIELD_GROUP_EATS])
+        self._set_cell(top, left, self._rnd.choice(config.AreaTypes[config.FIELD_GROUP_EATS]))
 
     def _check_pos(self, top, left):
         """ Проверяет, свободны ли на доске точки с заданными координатами """
         if top < 0 or top >= self._height or left < 0 or left >= self._width or \
-            self._area[top][left] in config.DeathTypes:
+            self._rows[top][left] in config.DeathTypes:
             return False
 
         return True
 
     def _check_pos_raise(self, top, left, barriers_only=False):
         if top < 0 or top >= self._height or left < 0 or left >= self._width:
-            raise StopGameException(config.LOSE_CODE, 'Удавчик убился об стену!')
-        if not barriers_only and self._area[top][left] == config.FIELD_TYPE_BODY:
+            raise StopGameException.from_reason(config.STOP_WALL)
+        cell_type = self._rows[top][left]
+
+        if not barriers_only and cell_type == config.FIELD_TYPE_BODY:
             if self._boa[1] == [top, left]:
-                raise StopGameException(config.LOSE_CODE, 'Удавчик свернулся внутрь себя!')
+                raise StopGameException.from_reason(config.STOP_SELF_REVERSE)
             else:
-                raise StopGameException(config.LOSE_CODE, 'Удавчик съел сам себя!')
-        if self._area[top][left] == config.FIELD_TYPE_HOLE:
-            raise StopGameException(config.LOSE_CODE, 'Удавчик провалился в дыру!')
-        if self._area[top][left] == config.FIELD_TYPE_ROCK:
-            raise StopGameException(config.LOSE_CODE, 'Удавчик протаранил скалу!')
+                raise StopGameException.from_reason(config.STOP_SELF_EAT)
+        if cell_type == config.FIELD_TYPE_HOLE:
+            raise StopGameException.from_reason(config.STOP_HOLE)
+        if cell_type == config.FIELD_TYPE_ROCK:
+            raise StopGameException.from_reason(config.STOP_ROCK)
 
     def _change_direction(self, horiz, vert):
         """ изменяет направление движения в заданной точке"""
-        if [horiz * -1, vert * -1] == self._boa_moves[0]:
-            # исключим вариант поворота на 180% (т.е. внутрь себя)
-            return
+        with self.locked():
+            if (-horiz, -vert) == self.last_move():
+                # исключим вариант поворота на 180% (т.е. внутрь себя)
+                return
 
-        self._direct_points[tuple(self._boa[0])] = [horiz, vert]
+            self._direct_points[tuple(self._boa[0])] = [horiz, vert]
+
+            for recorder in self._recorders:
+                recorder.turn((horiz, vert))
 
     def _rand_coord(self, cell_type_group):
-        coords = tuple((t, l) for t in range(self._width) for l in range(self._height)
-                       if self._check_pos(t, l) and self._area[t][l] not in config.AreaTypes[cell_type_group])
+        """ Случайная свободная клетка поля, не занятая фигурой из группы cell_type_group """
+        sets = [cells for group, cells in self._free.items() if group != cell_type_group]
+        n = self._rnd.randrange(sum(len(cells) for cells in sets) or 1)
+
+        for cells in sets:
+            if n < len(cells):
+                return divmod(cells.item(n), self._width)
 
-        if not coords:
-            return None, None
+            n -= len(cells)
 
-        res = random.choice(coords)
-        return res[0], res[1]
+        return None, None
 
     def _check_to_win(self):
-        for top in range(self._width):
-            for left in range(self._height):
-                if self._area[top][left] in config.AreaTypes[config.FIELD_GROUP_EMPTY] + \
-                    config.AreaTypes[config.FIELD_GROUP_EATS]:
-                    return False
+        return self._stats[config.FIELD_GROUP_EMPTY] + self._stats[config.FIELD_GROUP_EATS] == 0
+
+    def _to_queue(self):
+        """ перевести удавчика в режим перемещения очередью """
+        body = set(tuple(coord) for coord in self._boa[1:])
+        self._boa = collections.deque(self._boa)
+        self._boa_moves = collections.deque(self._boa_moves)
+
+        # тело в точности повторяет путь головы, так что точки поворота под телом больше не нужны,
+        # остаются только те, что еще предстоит пройти голове
+        self._direct_points = {k: v for k, v in self._direct_points.items() if k not in body}
+
+    def _move_segments(self):
+        """ Шаг игры: перемещение каждого элемента удавчика по своему вектору смещения. Время шага - O(n) """
+
+        last = copy.copy(self._boa[len(self._boa)-1])
+
+        # пробуем переместиться
+        for i in range(len(self._boa)):
+            # сначала проверим, если тут точка поворота - надо поменять направление движения точки удавчика
+            if tuple(self._boa[i]) in self._direct_points:
+                self._boa_moves[i] = copy.copy(self._direct_points[tuple(self._boa[i])])
+                if i == len(self._boa) - 1:
+                    # удалить пройденную точку поворота после того, как ее прошел последний элемент
+                    self._direct_points.pop(tuple(self._boa[i]))
+
+            # вычисляем новые координаты
+            for j in range(len(self._boa[i])):
+                self._boa[i][j] += self._boa_moves[i][j]
+
+            if i == 0:
+                self._check_pos_raise(*self._boa[i], barriers_only=True)
+
+        # если в новом месте жратва - надо удлинить хвост
+        if self._rows[self._boa[0][0]][self._boa[0][1]] in config.AreaTypes[config.FIELD_GROUP_EATS]:
+            self._boa.append(last)
+            self._boa_moves.append(copy.copy(self._boa_moves[len(self._boa_moves)-1]))
+        else:
+            self._set_cell(last[0], last[1], config.FIELD_TYPE_NONE)
 
-        return True
+        self._reflect_boa_on_area()
+        self._check_pos_raise(*self._boa[0])
+
+    def _move_queue(self):
+        """
+        Шаг игры: новая голова добавляется в начало очереди, хвост снимается с конца.
+        Время шага не зависит от длины удавчика
+        """
+
+        head = self._boa[0]
+        move = self._direct_points.pop(tuple(head), None) or self._boa_moves[0]
+        top, left = head[0] + move[0], head[1] + move[1]
+        self._check_pos_raise(top, left, barriers_only=True)
+
+        # если в новом месте жратва - хвост остается на месте
+        grow = self._rows[top][left] in config.AreaTypes[config.FIELD_GROUP_EATS]
+
+        self._boa.appendleft([top, left])
+        self._boa_moves.appendleft(list(move))
+
+        if not grow:
+            last = self._boa.pop()
+            self._boa_moves.pop()
+            self._set_cell(last[0], last[1], config.FIELD_TYPE_NONE)
+
+        if len(self._boa) > 1:
+            self._set_cell(head[0], head[1], config.FIELD_TYPE_BODY)
+
+        self._check_pos_raise(top, left)
+        self._set_cell(top, left, config.FIELD_TYPE_HEAD)
+        self._head_serial += 1
+        self._serials[top * self._width + left] = self._head_serial
 
     def _try_move(self):
         """ Центральный метод игры, обработка шага игры """
 
-        # если превышен определенный порог - игра пошла серьезная, убираем препятствия
-        if len(self._boa) == (self._width * self._height) // 4:
-            self.remove_barriers()
+        with self.locked():
+            # сначала - команды, накопившиеся с прошлого шага
+            self._apply_commands()
 
-        try:
-            while self._locked:
-                pass
+            for recorder in self._recorders:
+                recorder.tick()
+
+            # если превышен определенный порог - игра пошла серьезная, убираем препятствия
+            if len(self._boa) == (self._width * self._height) // 4:
+                self._remove_barriers()
 
             # проверить, вдруг победил
             if self._check_to_win():
-                raise StopGameException(config.WIN_CODE, 'Ура! Победа!')
-
-            self._locked = True
-            last = copy.copy(self._boa[len(self._boa)-1])
-
-            # пробуем переместиться
-            for i in range(len(self._boa)):
-                # сначала проверим, если тут точка поворота - надо поменять направление движения точки удавчика
-                if tuple(self._boa[i]) in self._direct_points:
-                    self._boa_moves[i] = copy.copy(self._direct_points[tuple(self._boa[i])])
-                    if i == len(self._boa) - 1:
-                        # удалить пройденную точку поворота после того, как ее прошел последний элемент
-                        self._direct_points.pop(tuple(self._boa[i]))
-
-                # вычисляем новые координаты
-                for j in range(len(self._boa[i])):
-                    self._boa[i][j] += self._boa_moves[i][j]
-
-                if i == 0:
-                    self._check_pos_raise(*self._boa[i], barriers_only=True)
-
-            # если в новом месте жратва - надо удлинить хвост
-            if self._area[self._boa[0][0]][self._boa[0][1]] in config.AreaTypes[config.FIELD_GROUP_EATS]:
-                self._boa.append(last)
-                self._boa_moves.append(copy.copy(self._boa_moves[len(self._boa_moves)-1]))
-            else:
-                self._area[last[0]][last[1]] = config.FIELD_TYPE_NONE
+                raise StopGameException.from_reason(config.STOP_WIN)
+
+            for feed in self._feeds:
+                feed._body_shifted = True
 
-            self._reflect_boa_on_area()
-            self._check_pos_raise(*self._boa[0])
+            if self._move_mech == config.MOVE_MECH_QUEUE:
+                self._move_queue()
+            else:
+                self._move_segments()
 
             # появление еды через каждые n шагов
             self._to_rise -= 1
 
             if self._to_rise <= 0:
-                self._to_rise = config.EatsRaiseInterval
+                self._to_rise = self.eats_interval
                 self._add_eat()
-        finally:
-            self._locked = False
@@ -1,26 +1,46 @@
 import os, sys
+import time
 import random
-import json
-import pickle
+import array
 import datetime
-import copy
-from colour import Color
+import threading
 
-from PyQt5.QtWidgets import QMainWindow, QDesktopWidget, QFrame, QMessageBox, QLabel
-from PyQt5.QtCore import Qt, QBasicTimer, pyqtSignal
-from PyQt5.QtGui import QPainter, QColor, QIcon
+from PyQt5.QtWidgets import QApplication, QMainWindow, QDesktopWidget, QFrame, QMessageBox, QLabel
+from PyQt5.QtCore import Qt, QBasicTimer, QRect, QTimer, pyqtSignal
+from PyQt5.QtGui import QPainter, QIcon
 
-from . import engine, utils, config
+# запись/просмотр повторов и автопилот нужны не в каждой игре, они импортируются по месту
+from . import engine, utils, config, palette, savefile, journal, profiler
+from .minimap import Minimap
+from .tiles import TileCache
+from .writer import Writer
 
 
 class Snake(QMainWindow):
 
-    def __init__(self, app, difficulty=config.DIFF_EASY, length=None, arrange_mech=None, cheats_on=False):
+    def __init__(self, app, difficulty=config.DIFF_EASY, length=None, arrange_mech=None, move_mech=None, grid=None,
+                 cheats_on=False, record_file=None, replay_file=None, replay_rate=1.0, width=None, height=None,
+                 profile_file=None, startup_time=None, spectator_port=None):
         super().__init__()
 
         self.app = app
-        self.box = GameBox(self, difficulty=difficulty, length=length, arrange_mech=arrange_mech, cheats_on=cheats_on)
+        self.profile_file = profile_file
+        self.box = GameBox(self, difficulty=difficulty, length=length, arrange_mech=arrange_mech, move_mech=move_mech,
+                           grid=grid, cheats_on=cheats_on, record_file=record_file, width=width, height=height,
+                           startup_time=startup_time)
         self.setCentralWidget(self.box)
+
+        if spectator_port is not None:
+            from .spectator import SpectatorServer
+
+            try:
+                spectators = SpectatorServer(self.box.engine, port=spectator_port)
+                spectators.start()
+                self.box.spectators = spectators
+            except Exception as e:
+                # например, порт занят - играем без трансляции
+                print(f'Spectator server: {e}')
+
         self.setWindowIcon(QIcon(config.MainIcon))
         self.setWindowTitle(config.MainWindowTitle)
 
@@ -28,19 +48,42 @@ class Snake(QMainWindow):
         self.center()
         self.show()
 
-        if config.NoAutosave:
-            self.box.start()
+        # окно должно показаться сразу: игра начинается уже из цикла событий, а автосохранение грузится в фоне
+        if replay_file:
+            QTimer.singleShot(0, lambda: self.box.play_replay(replay_file, rate=replay_rate))
+        elif config.NoAutosave:
+            QTimer.singleShot(0, self.box.start)
         else:
             self.box.load_and_start(config.AutosaveFile)
 
     def center(self):
         screen = QDesktopWidget().screenGeometry()
         size = self.geometry()
-        self.move((screen.width() - size.width()) / 2, (screen.height() - size.height()) / 2)
+        self.move((screen.width() - size.width()) // 2, (screen.height() - size.height()) // 2)
 
     def closeEvent(self, event):
-        if not config.NoAutosave:
-            self.box.save(config.AutosaveFile)
+        if self.box.recorder:
+            self.box.stop_recording()
+
+        self.box.writer.submit(palette.flush)
+
+        # сохранения, снимки журнала и градиенты пишутся в фоне - ждем их, но не бесконечно
+        if not self.box.writer.wait(config.SaveWaitTimeout):
+            print('Не дождались окончания записи на диск!')
+
+        if self.box.journal and self.box.journal.attached():
+            # игра и так записана в журнал, осталось сбросить на диск хвост лога
+            try:
+                self.box.journal.detach()
+                print(f'Saved to: {config.AutosaveFile}')
+            except Exception as e:
+                print(f'{e}')
+
+        if self.box.spectators:
+            self.box.spectators.stop()
+
+        if self.profile_file:
+            self.box.dump_profile(self.profile_file)
 
         print('< Exit >')
         super(Snake, self).closeEvent(event)
@@ -48,7 +91,15 @@ class Snake(QMainWindow):
 
 class GameBox(QFrame):
 
-    def __init__(self, parent, difficulty=config.DIFF_EASY, length=None, arrange_mech=None, cheats_on=False):
+    # игра, загруженная в фоне: имя файла и (заголовок, движок), None - нет файла, или исключение
+    loaded = pyqtSignal(str, object)
+    # ход загрузки в фоне: имя файла и доля загруженного
+    load_progress = pyqtSignal(str, float)
+    # сохранение в фоне закончено: имя файла и исключение, если не получилось
+    saved = pyqtSignal(str, object)
+
+    def __init__(self, parent, difficulty=config.DIFF_EASY, length=None, arrange_mech=None, move_mech=None, grid=None,
+                 cheats_on=False, record_file=None, width=None, height=None, startup_time=None):
         super().__init__(parent)
 
         sb_scales = (1, 2, 0)
@@ -63,102 +114,432 @@ class GameBox(QFrame):
         self.speed = 0
         self.isStarted = False
         self.isPaused = False
-        self.sp_interval = 1
-        self.engine = engine.Engine(config.BoxWidth, config.BoxHeight, boa_size=length, arrange_mech=arrange_mech)
+        # мигание после конца игры: цвет элемента тела - body_gradient[sp_perm[индекс + sp_offset]], сдвиг
+        # растет с каждым кадром мигания. sp_perm - перестановка для случайного мигания (None - без нее)
+        self.sp_offset = 0
+        self.sp_perm = None
+        # мигание приостановлено, пока окно скрыто
+        self.sp_paused = False
+        # шаги игры идут по часам, а не по таймеру: таймер срабатывает раз в кадр, и за кадр делается столько
+        # шагов, сколько набежало времени (lag, мс) с учетом ускорения turbo. last_frame - время прошлого кадра
+        self.last_frame = None
+        self.lag = 0.0
+        self.turbo = 1
+        self.dropped_ticks = 0
+        # размер поля для новых игр. У загруженной игры или записи он может быть другим - тогда он берется у движка
+        self.box_width = width or config.BoxWidth
+        self.box_height = height or config.BoxHeight
+        self.engine_args = dict(boa_size=length, arrange_mech=arrange_mech, move_mech=move_mech, grid=grid)
+        self.engine = engine.Engine(self.box_width, self.box_height, **self.engine_args)
+        # окно рисуется раньше, чем начнется игра - до тех пор поле пустое
+        self.engine.clear()
+        self.feed = self.engine.subscribe()
+        self.tiles = TileCache()
+        # размер клетки в пикселях и видимая часть поля (top, left, высота, ширина) в клетках
+        self.sw = 0
+        self.sh = 0
+        self.view = (0, 0, 0, 0)
+        self.minimap = Minimap()
+        self.show_minimap = config.Minimap
+        self.colors = {sq_type: palette.hex_to_rgb(color) for sq_type, color in config.Colors.items()
+                       if sq_type != config.FIELD_TYPE_BODY}
         self.set_difficulty(difficulty)
         self.timer = QBasicTimer()
         self.acc_timer = QBasicTimer()
         self.spark_timer = QBasicTimer()
+        self.autosave_timer = QBasicTimer()
+        # сохранения, снимки журнала и записи повторов пишутся на диск в фоне, по очереди
+        self.writer = Writer()
+        # трансляция игры зрителям (--serve), следит за текущим движком
+        self.spectators = None
+        self.journal = None if config.NoAutosave else \
+            journal.Journal(os.path.join(utils.get_save_dir(), config.AutosaveFile), writer=self.writer)
+        # запись игр в файл повтора и просмотр записи (тогда engine - движок проигрывателя, а свой - в game_engine)
+        self.record_file = record_file
+        # сколько игр записано за запуск: каждая - в свой файл (recording_file_name)
+        self.record_count = 0
+        self.recorder = None
+        self.recorder_file = None
+        self.player = None
+        self.game_engine = None
+        self.replay_rate = 1.0
+        self.autopilot = None
+        # какой файл сейчас грузится в фоне
+        self.loading = None
+        self.loaded.connect(self.on_loaded)
+        self.load_progress.connect(self.on_load_progress)
+        self.saved.connect(self.on_saved)
+        # --profile-startup: время запуска программы и уже отмеченные этапы запуска
+        self.startup_time = startup_time
+        self.startup_stages = set()
         self.setFocusPolicy(Qt.StrongFocus)
 
     def save(self, file_name):
+        """ Сохранение в фоне: снимок движка берется сразу, между шагами игры, а в файл он пишется в другом потоке """
         try:
-            fn = os.path.join(utils.get_save_dir(), file_name)
-
-            if os.path.exists(fn):
-                os.unlink(fn)
-
             if not self.isStarted:
                 return
 
-            data = bytes(json.dumps({
-                'speed': self.speed,
-                'start_time': self.start_time.timestamp(),
-                'difficulty': self._dif_code
-            }), 'utf-8')
+            with profiler.measure('save.snapshot', deadline=self.speed):
+                data = self.engine.snapshot(pack=False)
 
-            with open(fn, 'wb') as f:
-                f.write(utils.int_to_bytes(len(data)))
-                f.write(data)
-                f.write(pickle.dumps(self.engine))
+            self.writer.submit(self._save_worker, file_name, self.save_header(), data)
+        except Exception as e:
+            print(f'{e}')
 
-            print(f'Saved to: {file_name}')
+    def _save_worker(self, file_name, header, data):
+        try:
+            with profiler.measure('save'):
+                savefile.save_snapshot(os.path.join(utils.get_save_dir(), file_name), header, data)
+        except Exception as e:
+            self.saved.emit(file_name, e)
+        else:
+            self.saved.emit(file_name, None)
+
+    def on_saved(self, file_name, error):
+        print(f'{error}' if error else f'Saved to: {file_name}')
+
+    def read_save(self, file_name, progress=None):
+        """
+        Прочитать игру из файла. С окном не работает, так что может идти и не в потоке GUI
+
+        :param progress: функция(доля от 0 до 1) - ход загрузки
+        :return: tuple: (заголовок - dict, движок) или None, если файла нет
+        """
+
+        fn = os.path.join(utils.get_save_dir(), file_name)
+
+        if not os.path.exists(fn):
+            return None
+
+        with profiler.measure('load'):
+            return journal.recover(fn, progress=progress)
+
+    def apply_save(self, file_name, data, obj):
+        """ сделать прочитанную игру текущей """
+        self.speed = data['speed']
+        self.start_time = datetime.datetime.fromtimestamp(data['start_time'])
+        self.engine = obj
+        self.feed = self.engine.subscribe()
+        self.set_difficulty(data['difficulty'])
+        print(f'Loaded from: {file_name}')
+
+    def save_header(self):
+        return {
+            'speed': self.speed,
+            'start_time': self.start_time.timestamp(),
+            'difficulty': self._dif_code
+        }
+
+    def start_journal(self):
+        """ начать журнал автосохранения текущей игры """
+        if not self.journal:
+            return
+
+        try:
+            self.journal.attach(self.engine, self.save_header())
+            self.autosave_timer.start(config.AutosaveInterval, self)
+        except Exception as e:
+            print(f'{e}')
+
+    def autosave(self):
+        """ сбросить журнал автосохранения на диск """
+        try:
+            with profiler.measure('autosave', deadline=self.speed):
+                self.journal.sync()
         except Exception as e:
             print(f'{e}')
 
-    def load(self, file_name):
+    def start_recording(self, seed=None):
+        """ начать запись игры в файл повтора, seed - если игра только что начата с этим начальным значением """
+        if not self.record_file:
+            return
+
+        from . import replay
+
+        self.recorder = replay.Recorder(self.engine, {'difficulty': self._dif_code, 'speed': self.speed}, seed=seed)
+        self.record_count += 1
+        self.recorder_file = self.recording_file_name(self.record_count)
+
+    def recording_file_name(self, n):
+        """ файл записи n-й игры за запуск: первая - в record_file, следующие - с номером, чтобы не затирать """
+        if n == 1:
+            return self.record_file
+
+        name, ext = os.path.splitext(self.record_file)
+        return f'{name}-{n}{ext}'
+
+    def stop_recording(self, reason=None):
+        """ закончить запись и сохранить ее, reason - причина окончания игры """
+        if not self.recorder:
+            return
+
         try:
-            fn = os.path.join(utils.get_save_dir(), file_name)
-
-            if not os.path.exists(fn):
-                return False
-
-            with open(fn, 'rb') as f:
-                data_sz = utils.int_from_bytes(f.read(utils.int_size()))
-                data = json.loads(f.read(data_sz).decode('utf-8'))
-                obj = pickle.loads(f.read())
-
-            self.speed = data['speed']
-            self.start_time = datetime.datetime.fromtimestamp(data['start_time'])
-            self.engine = obj
-            self.set_difficulty(data['difficulty'])
-            print(f'Loaded from: {file_name}')
-            return True
+            self.recorder.stop(reason)
+            self.writer.submit(self._save_recording, self.recorder, self.recorder_file)
+        except Exception as e:
+            print(f'{e}')
+
+        self.recorder = None
+
+    def _save_recording(self, recorder, file_name):
+        recorder.save(file_name)
+        print(f'Replay saved to: {file_name}')
+
+    def play_replay(self, file_name, rate=1.0):
+        """ показать запись игры из файла file_name, rate - во сколько раз быстрее, чем шла игра """
+        from . import replay
+
+        self.stop_sparkle()
+        self.loading = None
+
+        if self.isStarted:
+            self.stop('Игра остановлена')
+
+        self.clear_status_messages()
+
+        try:
+            player = replay.Player(file_name)
+        except Exception as e:
+            print(f'{e}')
+            self.start()
+            return
+
+        self.game_engine = self.game_engine or self.engine
+        self.player = player
+        self.replay_rate = rate
+        self.set_player_engine()
+        self.speed = self.player.header.get('speed') or self._difficulty['InitialSpeed']
+        self.init_body_gradient()
+
+        self.set_status_message(f'Размер: {self.engine.length()}')
+        self.set_status_message(f'Запись: {self.player.ticks} / {self.player.total_ticks()}', index=1)
+        self.isPaused = False
+        self.isStarted = True
+        self.start_ticks()
+        self.start_time = datetime.datetime.now()
+        print(f'< Replay: {file_name} >')
+        self.update()
+
+    def leave_replay(self):
+        """ закончить просмотр записи, вернуть свой движок """
+        if not self.player:
+            return
+
+        self.player = None
+        self.engine = self.game_engine
+        self.game_engine = None
+        self.feed = self.engine.subscribe()
+
+    def set_player_engine(self):
+        """ после перемотки у проигрывателя может быть другой движок """
+        if self.engine is not self.player.game:
+            self.engine.unsubscribe(self.feed)
+            self.engine = self.player.game
+            self.feed = self.engine.subscribe()
+
+    def replay_interval(self):
+        return self.speed / self.replay_rate
+
+    def tick_interval(self):
+        """ интервал между шагами в мс: у игры - скорость, у просмотра записи - с учетом ускорения """
+        return self.replay_interval() if self.player else self.speed
+
+    def start_ticks(self):
+        """ запустить (после паузы - продолжить) шаги игры, время до паузы не считается """
+        self.last_frame = time.monotonic()
+        self.lag = 0.0
+        self.timer.start(config.FrameInterval, self)
+        self.report_startup('game ready')
+
+    def report_startup(self, stage):
+        """ --profile-startup: сколько прошло от запуска программы до этапа stage (каждый этап - один раз) """
+        if self.startup_time is None or stage in self.startup_stages:
+            return
+
+        self.startup_stages.add(stage)
+        print(f'Startup: {stage}: {round((time.perf_counter() - self.startup_time) * 1000, 1)} ms')
+
+    def frame(self):
+        """
+        Кадр: все шаги игры, время которых подошло с прошлого кадра. Если GUI подвис, шаги догоняются, но не
+        больше config.MaxTicksPerFrame за кадр - остальные пропускаются, чтобы не догонять бесконечно.
+        Перерисовка - одна на кадр, после всех шагов (update_ui в timerEvent)
+        """
+
+        now = time.monotonic()
+        profiler.add('frame.interval', now - self.last_frame, deadline=config.FrameInterval * config.ProfileLateRatio)
+        self.lag += (now - self.last_frame) * 1000 * self.turbo
+        self.last_frame = now
+        interval = self.tick_interval()
+        ticks = 0
+
+        while self.lag >= interval and self.isStarted and not self.isPaused:
+            if ticks >= config.MaxTicksPerFrame:
+                self.dropped_ticks += int(self.lag // interval)
+                self.lag %= interval
+                break
+
+            self.lag -= interval
+            ticks += 1
+            self.tick()
+
+    def tick(self):
+        """ шаг игры или просмотра записи """
+        with profiler.measure('tick', deadline=self.tick_interval()):
+            if self.player:
+                self.replay_step()
+                return
+
+            if self.autopilot:
+                self.autopilot.step(self.engine)
+
+            self.engine.move()
+
+    def replay_step(self):
+        """ шаг просмотра записи """
+        if not self.player.step():
+            self.stop('Запись закончилась')
+            return
+
+        if self.player.header.get('speed'):
+            self.speed = self.player.header['speed']
+
+        self.set_status_message(f'Запись: {self.player.ticks} / {self.player.total_ticks()}', index=1)
+
+    def replay_seek(self, ticks):
+        """ перемотка записи на ticks шагов вперед (назад - если меньше 0) """
+        self.stop_sparkle()
+        self.init_body_gradient()
+
+        try:
+            self.player.seek(max(0, self.player.ticks + ticks))
+        finally:
+            # перемотка могла дойти до конца игры (StopGameException) - показать надо то, на чем она кончилась
+            self.set_player_engine()
+        self.isStarted = True
+        self.speed = self.player.header.get('speed') or self.speed
+
+        if not self.isPaused:
+            self.start_ticks()
+
+        self.set_status_message(f'Запись: {self.player.ticks} / {self.player.total_ticks()}', index=1)
+        self.update()
+
+    def replay_key(self, key):
+        """ управление просмотром записи """
+        if key == Qt.Key_Right:
+            self.replay_seek(config.ReplayKeyframeTicks)
+        elif key == Qt.Key_Left:
+            self.replay_seek(-config.ReplayKeyframeTicks)
+        elif key in (Qt.Key_Plus, Qt.Key_Minus) and self.isStarted:
+            self.replay_rate = self.replay_rate * 2 if key == Qt.Key_Plus else self.replay_rate / 2
+            print(f'Replay rate: {self.replay_rate}')
+
+    def stop_journal(self):
+        """ игра закончилась - автосохранение больше не нужно """
+        if not self.journal:
+            return
+
+        self.autosave_timer.stop()
+
+        try:
+            self.journal.discard()
         except Exception as e:
             print(f'{e}')
-            return False
 
     def load_and_start(self, file_name):
-        self.spark_timer.stop()
+        """ загрузить игру и запустить ее на паузе. Файл читается в фоне, а пока - пустое поле и "Загрузка..." """
+        self.stop_sparkle()
 
         if self.isStarted:
             self.stop('Игра остановлена')
 
+        self.leave_replay()
         self.clear_status_messages()
+        self.set_status_message('Загрузка...', index=1)
+        self.loading = file_name
+        threading.Thread(target=self._load_worker, args=(file_name,), daemon=True).start()
+
+    def _load_worker(self, file_name):
+        # сохранение в этот файл может еще писаться
+        self.writer.wait(config.SaveWaitTimeout)
+        shown = [-1]
+
+        def progress(fraction):
+            # проценты - в строку состояния, но не чаще, чем они меняются
+            if int(fraction * 100) != shown[0]:
+                shown[0] = int(fraction * 100)
+                self.load_progress.emit(file_name, fraction)
+
+        try:
+            result = self.read_save(file_name, progress=progress)
+        except Exception as e:
+            result = e
+
+        # сигнал из другого потока доставляется в поток GUI через очередь событий
+        self.loaded.emit(file_name, result)
+
+    def on_load_progress(self, file_name, fraction):
+        if file_name == self.loading:
+            self.set_status_message(f'Загрузка... {int(fraction * 100)}%', index=1)
+
+    def on_loaded(self, file_name, result):
+        if file_name != self.loading:
+            # пока файл грузился, игрок начал другую игру
+            return
+
+        self.loading = None
+        self.set_status_message('', index=1)
+
+        if isinstance(result, Exception):
+            print(f'{result}')
+            result = None
 
-        if not self.load(file_name):
+        if result is None:
             self.start()
             return
 
-        self.sp_alg = random.choice((config.SP_ALG_RANDOM, config.SP_ALG_ALONG_BODY))
-        self.body_gradient = list(Color(config.Colors[config.FIELD_TYPE_BODY][0]).range_to(
-            Color(config.Colors[config.FIELD_TYPE_BODY][1]), (config.BoxWidth * config.BoxHeight) - 1))
+        self.apply_save(file_name, *result)
+        self.start_loaded()
+
+    def start_loaded(self):
+        """ запустить только что загруженную игру (на паузе) """
+        self.init_body_gradient()
 
         self.set_status_message(f'Размер: {self.engine.length()}')
         self.isPaused = False
         self.isStarted = True
         self.engine.start()
-        self.timer.start(self.speed, self)
+        self.start_ticks()
         self.acc_timer.start(config.AccInterval, self)
 
         if not self.start_time:
             self.start_time = datetime.datetime.now()
 
+        self.start_journal()
+        self.start_recording()
         print('< Started >')
         self.update()
         self.pause()
 
     def start(self):
-        self.spark_timer.stop()
+        self.stop_sparkle()
+        self.loading = None
 
         if self.isStarted:
             self.stop('Игра остановлена')
 
+        self.leave_replay()
         self.clear_status_messages()
-        self.engine.clear()
-        self.sp_alg = random.choice((config.SP_ALG_RANDOM, config.SP_ALG_ALONG_BODY))
-        self.body_gradient = list(Color(config.Colors[config.FIELD_TYPE_BODY][0]).range_to(
-            Color(config.Colors[config.FIELD_TYPE_BODY][1]), (config.BoxWidth * config.BoxHeight) - 1))
+
+        if self.engine.size() != (self.box_height, self.box_width):
+            self.new_engine()
+
+        # у каждой игры свое начальное значение генератора - по нему и вводу игрока игру можно повторить
+        seed = random.getrandbits(63)
+        self.engine.clear(seed=seed)
+        self.init_body_gradient()
 
         self.set_status_message(f'Размер: {self.engine.length()}')
         self.set_difficulty(self._next_diff)
@@ -166,18 +547,31 @@ class GameBox(QFrame):
         self.isStarted = True
         self.speed = self._difficulty['InitialSpeed']
         self.engine.start()
-        self.timer.start(self.speed, self)
+        self.start_ticks()
         self.acc_timer.start(config.AccInterval, self)
         self.start_time = datetime.datetime.now()
+        self.start_journal()
+        self.start_recording(seed)
         print('< Started >')
         self.update()
 
-    def stop(self, message=''):
+    def new_engine(self):
+        """ движок с полем заданного для новых игр размера (если до этого была загружена игра на другом поле) """
+        self.engine.unsubscribe(self.feed)
+        self.engine = engine.Engine(self.box_width, self.box_height, **self.engine_args)
+        self.engine.difficulty = self._difficulty
+        self.feed = self.engine.subscribe()
+
+    def stop(self, message='', reason=None):
         if not self.isStarted:
             return
 
         self.timer.stop()
         self.acc_timer.stop()
+        self.stop_journal()
+        self.stop_recording(reason)
+        # градиент тела, досчитанный за игру - в профиль, в фоне
+        self.writer.submit(palette.flush)
         self.isStarted = False
         self.isPaused = False
         self.set_status_messages((f'Размер: {self.engine.length()}', f'{message}'))
@@ -197,8 +591,11 @@ class GameBox(QFrame):
             self.update()
         else:
             self.set_status_message('', index=1)
-            self.timer.start(self.speed, self)
-            self.acc_timer.start(config.AccInterval, self)
+
+            self.start_ticks()
+
+            if not self.player:
+                self.acc_timer.start(config.AccInterval, self)
 
     def set_difficulty(self, new_dif):
         if new_dif not in config.Difficultys:
@@ -223,17 +620,47 @@ class GameBox(QFrame):
             self.speed *= config.Accelerator
             print(f'Speed increased to: {round(self.speed / 1000, 3)}')
 
-            if not self.isPaused:
-                self.timer.stop()
-                self.timer.start(self.speed, self)
+            self.speed_changed()
 
     def decelerate(self):
         self.speed /= config.Accelerator
         print(f'Speed decreased to: {round(self.speed / 1000, 3)}')
 
-        if not self.isPaused:
-            self.timer.stop()
-            self.timer.start(self.speed, self)
+        self.speed_changed()
+
+    def init_body_gradient(self):
+        self.sp_alg = random.choice((config.SP_ALG_RANDOM, config.SP_ALG_ALONG_BODY))
+        self.sp_offset = 0
+        self.sp_perm = None
+        self.body_gradient = palette.get_palette(config.Colors[config.FIELD_TYPE_BODY][0],
+                                                 config.Colors[config.FIELD_TYPE_BODY][1],
+                                                 self.engine.size()[0] * self.engine.size()[1] - 1)
+
+    def toggle_autopilot(self):
+        if self.autopilot:
+            self.autopilot.detach()
+            self.autopilot = None
+        else:
+            from .autopilot import Autopilot
+
+            self.autopilot = Autopilot()
+
+        print(f'Autopilot: {"ON" if self.autopilot else "OFF"}')
+
+    def toggle_turbo(self):
+        """ ускоренная перемотка: шагов в config.TurboRate раз больше, кадров - столько же """
+        self.turbo = 1 if self.turbo > 1 else config.TurboRate
+        print(f'Turbo: {"x" + str(self.turbo) if self.turbo > 1 else "OFF"}')
+
+    def toggle_minimap(self):
+        self.show_minimap = not self.show_minimap
+        self.update()
+
+    def speed_changed(self):
+        if self.journal:
+            self.journal.header(speed=self.speed)
+        if self.recorder:
+            self.recorder.header_changes({'speed': self.speed})
 
     def sparkle(self, method):
         if method == config.WIN_CODE:
@@ -241,22 +668,47 @@ class GameBox(QFrame):
         else:
             c1, c2 = config.SpLose_GradColor_1, config.SpLose_GradColor_2
 
-        self.body_gradient = list(Color(c1).range_to(Color(c2), self.engine.length()))
-        self.spark_timer.start(self.sp_interval, self)
+        # размер градиента тут зависит от длины удавчика, на диск такие не сохраняем
+        self.body_gradient = list(palette.get_palette(c1, c2, max(1, self.engine.length()), disk_cache=False))
+        self.sp_offset = 0
+
+        if self.sp_alg == config.SP_ALG_RANDOM:
+            # случайно: цвета перемешиваются один раз, а в каждом кадре - сдвиг по этой перестановке
+            self.sp_perm = array.array('i', range(len(self.body_gradient)))
+            random.shuffle(self.sp_perm)
+
+        self.spark_timer.start(self.sparkle_interval(), self)
+
+    def sparkle_interval(self):
+        """ кадр мигания: не чаще обновления экрана и не чаще, чем раз в config.FrameInterval """
+        screen = QApplication.primaryScreen()
+        rate = screen.refreshRate() if screen else 0
+        return max(config.FrameInterval, int(1000 / rate) if rate > 0 else 0)
 
     def sparkle_step(self):
-        """ Кое-какие шаги для подготовки к отрисовке мигания """
+        """ кадр мигания: цвета тела сдвигаются на один (вдоль тела - назад, к хвосту) """
+        with profiler.measure('sparkle'):
+            self.sp_offset = (self.sp_offset + 1) % len(self.body_gradient)
 
-        if self.sp_alg == config.SP_ALG_RANDOM:
-            # случайно: перемешаем массив цветов
-            random.shuffle(self.body_gradient)
-        elif self.sp_alg == config.SP_ALG_ALONG_BODY:
-            # вдоль тела: сдвинем массив цветов назад
-            for i in range(len(self.body_gradient)):
-                if i < len(self.body_gradient) - 1:
-                    self.body_gradient[i] = self.body_gradient[i + 1]
-                else:
-                    self.body_gradient[i] = self.body_gradient[0]
+    def stop_sparkle(self):
+        self.spark_timer.stop()
+        self.sp_paused = False
+
+    def hideEvent(self, event):
+        # окно свернуто или скрыто - мигание не считается и не рисуется
+        if self.spark_timer.isActive():
+            self.spark_timer.stop()
+            self.sp_paused = True
+
+        super(GameBox, self).hideEvent(event)
+
+    def showEvent(self, event):
+        if self.sp_paused:
+            self.sp_paused = False
+            self.spark_timer.start(self.sparkle_interval(), self)
+            self.update()
+
+        super(GameBox, self).showEvent(event)
 
     def show_help(self):
         if self.isStarted:
@@ -264,7 +716,8 @@ class GameBox(QFrame):
 
         QMessageBox.information(self.parent(), 'Подсказка',
                                 '\n'.join(('Клавиши управления игрой\n',) + config.HELP_KEYS +
-                                          ('--------------------\n',) + config.HELP_CHEAT_KEYS), QMessageBox.Ok)
+                                          ('--------------------\n',) + config.HELP_CHEAT_KEYS +
+                                          ('--------------------\n',) + config.HELP_REPLAY_KEYS), QMessageBox.Ok)
 
     def print_debug_info(self):
         print('-= Window =-')
@@ -274,6 +727,9 @@ class GameBox(QFrame):
         print(f'Width: {self.parent().geometry().width()}')
         print(f'Area Height: {self.contentsRect().height()}')
         print(f'Area Width: {self.contentsRect().width()}')
+        print(f'Cell size: {self.sw} x {self.sh}')
+        print(f'View: top {self.view[0]}, left {self.view[1]}, {self.view[2]} x {self.view[3]} cells')
+        print(f'Minimap: {"ON" if self.minimap_visible() else "OFF"}')
 
         print('')
         self.engine.print_debug_info()
@@ -281,6 +737,7 @@ class GameBox(QFrame):
         print('')
         print('-= Game =-')
         print(f'Cheats mode: {"ON" if self.cheats_on else "OFF"}')
+        print(f'Autopilot: {"ON" if self.autopilot else "OFF"}')
         print(f'Difficulty: {self._difficulty["EngName"]}')
         print(f'Started: {self.isStarted}')
         print(f'Paused: {self.isPaused}')
@@ -291,16 +748,75 @@ class GameBox(QFrame):
 
         print(f'Initial speed: {round(self._difficulty["InitialSpeed"] / 1000, 3)}')
         print(f'Current speed: {round(self.speed / 1000, 3)}')
+        print(f'Turbo: {self.turbo}')
+        print(f'Dropped ticks: {self.dropped_ticks}')
         print(f'Acceleration coefficient: {config.Accelerator}')
         print(f'Acceleration frozen: {self._difficulty["Freeze"]}')
 
-    def scale_width(self):
-        """ масштабирование - рассчитывает размер стороны квадрата в пикселях по оси X (ширина) """
-        return self.contentsRect().width() // config.BoxWidth
+        print('')
+        profiler.print_report()
+
+        if self.parent().profile_file:
+            self.dump_profile(self.parent().profile_file)
+
+    def dump_profile(self, file_name):
+        """ записать замеры времени в JSON """
+        if not profiler.enabled:
+            return
+
+        try:
+            profiler.dump(file_name)
+            print(f'Profile saved to: {file_name}')
+        except Exception as e:
+            print(f'{e}')
 
-    def scale_height(self):
-        """ масштабирование - рассчитывает размер стороны квадрата в пикселях по оси Y (высота) """
-        return self.contentsRect().height() // config.BoxHeight
+    def update_view(self):
+        """
+        Масштабирование: размер клетки в пикселях и видимая часть поля. Поле показывается целиком, если клетки
+        выходят не мельче config.MinCellSize, иначе - только часть поля вокруг головы, клетками этого размера
+
+        :return: bool: масштаб или видимая часть изменились, т.е. перерисовать надо все
+        """
+
+        h, w = self.engine.size()
+        area = self.contentsRect()
+        sw, sh = area.width() // w, area.height() // h
+
+        if min(sw, sh) >= config.MinCellSize:
+            view = (0, 0, h, w)
+        else:
+            sw = sh = config.MinCellSize
+            rows, cols = max(1, min(h, area.height() // sh)), max(1, min(w, area.width() // sw))
+            top, left = self.view[:2]
+
+            if self.engine.length():
+                head_top, head_left = self.engine.head()
+                top = self._follow(top, rows, head_top)
+                left = self._follow(left, cols, head_left)
+
+            view = (max(0, min(top, h - rows)), max(0, min(left, w - cols)), rows, cols)
+
+        changed = (sw, sh, view) != (self.sw, self.sh, self.view)
+        self.sw, self.sh, self.view = sw, sh, view
+        return changed
+
+    @staticmethod
+    def _follow(pos, size, target):
+        """
+        Камера по одной оси: пока цель в средней половине окна, окно стоит на месте, а когда цель выходит
+        за нее - окно центрируется на цели. Так полная перерисовка нужна раз в несколько шагов, а не на каждом
+        """
+
+        margin = size // 4
+
+        if target < pos + margin or target >= pos + size - margin:
+            return target - size // 2
+
+        return pos
+
+    def minimap_visible(self):
+        """ карта поля нужна, только если поле не влезает в окно целиком """
+        return self.show_minimap and self.view[2:] != self.engine.size()
 
     def keyPressEvent(self, event):
         key = event.key()
@@ -319,6 +835,12 @@ class GameBox(QFrame):
                 self.set_difficulty((Qt.Key_1, Qt.Key_2, Qt.Key_3, Qt.Key_4, Qt.Key_5).index(key) + 1)
             elif key == Qt.Key_F1:
                 self.show_help()
+            elif key == Qt.Key_M:
+                self.toggle_minimap()
+            elif key == Qt.Key_T:
+                self.toggle_turbo()
+            elif self.player:
+                self.replay_key(key)
             elif not self.isStarted or self.isPaused:
                 return
             elif key == Qt.Key_F5:
@@ -327,6 +849,8 @@ class GameBox(QFrame):
                 self.load_and_start(config.QuicksaveFile)
             elif key == Qt.Key_E:
                 self.stop('Игра остановлена игроком')
+            elif key == Qt.Key_A:
+                self.toggle_autopilot()
             elif key == Qt.Key_Right:
                 self.engine.turn_right()
             elif key == Qt.Key_Left:
@@ -349,7 +873,7 @@ class GameBox(QFrame):
             else:
                 super(GameBox, self).keyPressEvent(event)
         except engine.StopGameException as e:
-            self.stop(str(e))
+            self.stop(str(e), e.reason)
             self.sparkle(e.code)
         finally:
             self.update_ui()
@@ -357,29 +881,105 @@ class GameBox(QFrame):
     def timerEvent(self, event):
         try:
             if event.timerId() == self.timer.timerId():
-                self.engine.move()
+                self.frame()
             elif event.timerId() == self.acc_timer.timerId() and not self._difficulty['Freeze']:
                 self.accelerate()
             elif event.timerId() == self.spark_timer.timerId():
-                self.sparkle_step()
-                self.update_ui()
+                if not self.window().isMinimized():
+                    self.sparkle_step()
+            elif event.timerId() == self.autosave_timer.timerId():
+                self.autosave()
             else:
                 super(GameBox, self).timerEvent(event)
         except engine.StopGameException as e:
-            self.stop(str(e))
+            self.stop(str(e), e.reason)
             self.sparkle(e.code)
         finally:
             self.update_ui()
 
     def paintEvent(self, event):
-        for i in range(config.BoxHeight):
-            for j in range(config.BoxWidth):
-                self.draw_square(j, i, self.engine.cell(i, j))
+        with profiler.measure('paint', deadline=self.tick_interval() if self.isStarted else None):
+            self._paint(event)
+
+        self.report_startup('first frame')
+
+    def _paint(self, event):
+        if self.update_view():
+            # камера сдвинулась раньше, чем дошло до update_ui (например, сразу после загрузки)
+            self.update()
+
+        sw, sh = self.sw, self.sh
+
+        if not sw or not sh:
+            return
+
+        self.tiles.resize(sw, sh)
+        painter = QPainter(self)
+        top, left, rows, cols = self.view
+
+        try:
+            # рисуем только видимые клетки, попавшие в область перерисовки
+            for rect in event.region().rects():
+                for i in range(top + rect.top() // sh, top + min(rect.bottom() // sh + 1, rows)):
+                    for j in range(left + rect.left() // sw, left + min(rect.right() // sw + 1, cols)):
+                        self.draw_square(painter, j, i, self.engine.cell(i, j))
+
+            if self.minimap_visible():
+                rect = self.minimap.rect(self.contentsRect())
+
+                if event.region().intersects(rect):
+                    self.minimap.attach(self.engine)
+                    self.minimap.draw(painter, rect, self.view)
+        finally:
+            painter.end()
+
+    def resizeEvent(self, event):
+        self.tiles.invalidate()
+        super(GameBox, self).resizeEvent(event)
 
     def update_ui(self):
         if self.isStarted and not self.isPaused:
             self.set_status_message(f'Размер: {self.engine.length()}')
-        self.update()
+
+        if self.spectators:
+            self.spectators.attach(self.engine)
+
+        cells, body_shifted = self.feed.pop()
+        view_changed = self.update_view()
+
+        if self.minimap_visible():
+            if cells is None:
+                self.minimap.rebuild(self.engine)
+            else:
+                self.minimap.update_cells(self.engine, cells)
+
+            if cells is None or cells:
+                self.update(self.minimap.rect(self.contentsRect()))
+        else:
+            # скрытая карта не обновляется, при показе она строится заново
+            self.minimap.invalidate()
+
+        if cells is None or view_changed or self.spark_timer.isActive():
+            self.update()
+            return
+
+        top, left, rows, cols = self.view
+
+        if body_shifted:
+            # цвет элемента тела зависит от его индекса, а при шаге индексы сдвигаются у всего тела
+            if self.engine.length() > rows * cols:
+                self.update()
+                return
+
+            cells.update(self.engine.body_indexes())
+
+        if len(cells) * 4 > rows * cols:
+            self.update()
+            return
+
+        for i, j in cells:
+            if top <= i < top + rows and left <= j < left + cols:
+                self.update(QRect((j - left) * self.sw, (i - top) * self.sh, self.sw, self.sh))
 
     def set_status_messages(self, messages):
         """
@@ -410,28 +1010,18 @@ class GameBox(QFrame):
     def clear_status_messages(self):
         self.set_status_messages(('', '', ''))
 
-    def draw_square(self, left, top, sq_type):
-        """ отрисовка квадратика """
+    def draw_square(self, painter, left, top, sq_type):
+        """ отрисовка квадратика готовым тайлом, размер клетки берется из кэша тайлов """
 
-        w = left * self.scale_width()
-        h = top * self.scale_height()
+        if sq_type == config.FIELD_TYPE_BODY:
+            i = self.engine.body_index(top, left) + self.sp_offset
 
-        painter = QPainter(self)
+            if self.sp_perm is not None:
+                i = self.sp_perm[i % len(self.sp_perm)]
 
-        if sq_type == config.FIELD_TYPE_NONE:
-            painter.fillRect(w, h, self.scale_width(), self.scale_height(), QColor(config.Colors[sq_type]))
-            return
-        elif sq_type == config.FIELD_TYPE_BODY:
-            color = QColor(self.body_gradient[self.engine.body_index(top, left)].get_hex())
+            rgb = self.body_gradient[i % len(self.body_gradient)]
         else:
-            color = QColor(config.Colors[sq_type])
-
-        painter.fillRect(w + 1, h + 1, self.scale_width() - 2, self.scale_height() - 2, color)
-
-        painter.setPen(color.lighter())
-        painter.drawLine(w, h + self.scale_height() - 1, w, h)
-        painter.drawLine(w, h, w + self.scale_width() - 1, h)
+            rgb = self.colors[sq_type]
 
-        painter.setPen(color.darker(150))
-        painter.drawLine(w + 1, h + self.scale_height() - 1, w + self.scale_width() - 1, h + self.scale_height() - 1)
-        painter.drawLine(w + self.scale_width() - 1, h + self.scale_height() - 1, w + self.scale_width() - 1, h + 1)
+        painter.drawPixmap((left - self.view[1]) * self.tiles.width, (top - self.view[0]) * self.tiles.height,
+                           self.tiles.tile(rgb, bevel=sq_type != config.FIELD_TYPE_NONE))
@@ -0,0 +1,209 @@
+import sys
+import time
+import array
+import random
+
+from . import engine, config
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+POLICY_RANDOM = 'random'
+POLICY_SCRIPT = 'script'
+POLICY_AUTO = 'auto'
+Policies = (POLICY_RANDOM, POLICY_SCRIPT, POLICY_AUTO)
+
+DIRECTIONS = {
+    'U': (-1, 0),
+    'D': (1, 0),
+    'L': (0, -1),
+    'R': (0, 1)
+}
+
+
+def turn(game, direct):
+    """ повернуть удавчика в направлении (top, left) """
+    {
+        (-1, 0): game.turn_up,
+        (1, 0): game.turn_down,
+        (0, -1): game.turn_left,
+        (0, 1): game.turn_right
+    }[direct]()
+
+
+class RandomPolicy(object):
+    """ Случайные повороты. Если впереди препятствие - пробует свернуть туда, где свободно """
+
+    def __init__(self, turn_rate=0.1, rnd=None):
+        self.turn_rate = turn_rate
+        self._rnd = rnd or random.Random()
+
+    def step(self, game):
+        top, left = game.head()
+        height, width = game.size()
+
+        def is_free(direct):
+            t, l = top + direct[0], left + direct[1]
+            return 0 <= t < height and 0 <= l < width and game.cell(t, l) not in config.DeathTypes
+
+        if self._rnd.random() >= self.turn_rate and is_free(game.direction()):
+            return
+
+        free = [direct for direct in DIRECTIONS.values() if is_free(direct)]
+
+        if free:
+            turn(game, self._rnd.choice(free))
+
+
+class ScriptPolicy(object):
+    """ Повороты по сценарию: строка из U, D, L, R (повернуть) и . (ничего не делать), по символу на шаг, по кругу """
+
+    def __init__(self, script):
+        if not script or any(c not in DIRECTIONS and c != '.' for c in script.upper()):
+            raise Exception(f'Неверный сценарий: "{script}"! Допустимые символы: U, D, L, R, .')
+
+        self._script = script.upper()
+        self._pos = 0
+
+    def step(self, game):
+        c = self._script[self._pos]
+        self._pos = (self._pos + 1) % len(self._script)
+
+        if c in DIRECTIONS:
+            turn(game, DIRECTIONS[c])
+
+
+def make_policy(name, script=None, seed=None):
+    if name == POLICY_SCRIPT:
+        return ScriptPolicy(script)
+    if name == POLICY_RANDOM:
+        return RandomPolicy(rnd=random.Random(seed))
+    if name == POLICY_AUTO:
+        # автопилот сам пользуется turn() отсюда
+        from .autopilot import Autopilot
+        return Autopilot()
+
+    raise Exception(f'Неизвестная стратегия управления: {name}! Возможные значения: {", ".join(Policies)}')
+
+
+def new_game(width, height, length=None, arrange_mech=None, move_mech=None, grid=None, difficulty=config.DIFF_EASY,
+             seed=None, barriers=None, eats_interval=None):
+    """
+    Новая запущенная игра. barriers и eats_interval переопределяют настройки только для этой игры,
+    глобальный config не меняется
+    """
+    game = engine.Engine(width, height, boa_size=length, arrange_mech=arrange_mech, move_mech=move_mech, grid=grid,
+                         seed=seed)
+    game.difficulty = dict(config.Difficultys[difficulty])
+
+    if barriers is not None:
+        game.difficulty['Barriers'] = barriers
+    if eats_interval is not None:
+        game.eats_interval = eats_interval
+
+    game.clear()
+    game.start()
+    return game
+
+
+def peak_memory():
+    """ пиковый размер памяти процесса в байтах, None - если узнать нельзя """
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux отдает килобайты, macos - байты
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def percentile(values, p):
+    """ перцентиль p (0 - 100) по отсортированному массиву """
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def benchmark(width, height, length=None, arrange_mech=None, move_mech=None, grid=None, difficulty=config.DIFF_EASY,
+              ticks=None, games=None, policy=None, seed=None, spectators=None):
+    """
+    Гоняет движок без отрисовки с максимальной скоростью, пока не наберется ticks шагов или не закончится
+    games игр (что раньше). Закончившаяся игра сразу начинается заново. spectators - сервер трансляции игры
+    (spectator.SpectatorServer)
+
+    :return: dict: статистика прогона
+    """
+
+    if not ticks and not games:
+        ticks = 100000
+
+    policy = policy or make_policy(POLICY_RANDOM, seed=seed)
+    latencies = array.array('d')
+    results = {config.WIN_CODE: 0, config.LOSE_CODE: 0}
+    lengths = []
+    n_games = 0
+    setup_time = 0.0
+
+    started = t = time.perf_counter()
+    game = new_game(width, height, length, arrange_mech, move_mech, grid, difficulty, seed=seed)
+    setup_time += time.perf_counter() - t
+
+    if spectators:
+        spectators.attach(game)
+
+    while (not ticks or len(latencies) < ticks) and (not games or n_games < games):
+        policy.step(game)
+        t = time.perf_counter()
+
+        try:
+            game.move()
+            latencies.append(time.perf_counter() - t)
+        except engine.StopGameException as e:
+            latencies.append(time.perf_counter() - t)
+            results[e.code] += 1
+            lengths.append(game.length())
+            n_games += 1
+
+            t = time.perf_counter()
+            game.clear()
+            game.start()
+            setup_time += time.perf_counter() - t
+
+    total = time.perf_counter() - started
+    step_time = sum(latencies)
+    latencies = sorted(latencies)
+
+    return {
+        'width': width,
+        'height': height,
+        'ticks': len(latencies),
+        'games': n_games,
+        'wins': results[config.WIN_CODE],
+        'loses': results[config.LOSE_CODE],
+        'avg_length': sum(lengths) / len(lengths) if lengths else game.length(),
+        'total_time': total,
+        'setup_time': setup_time,
+        'ticks_per_sec': len(latencies) / step_time if step_time else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else 0.0,
+        'peak_memory': peak_memory()
+    }
+
+
+def print_report(stats):
+    mem = stats['peak_memory']
+
+    print('-= Headless benchmark =-')
+    print(f'Board: {stats["width"]} x {stats["height"]}')
+    print(f'Ticks: {stats["ticks"]}  Games finished: {stats["games"]} '
+          f'(wins: {stats["wins"]}, loses: {stats["loses"]})')
+    print(f'Average final length: {round(stats["avg_length"], 1)}')
+    print(f'Total time: {round(stats["total_time"], 3)} s  (game setup: {round(stats["setup_time"], 3)} s)')
+    print(f'Ticks/sec: {round(stats["ticks_per_sec"])}')
+    print(f'Tick latency, us:  p50: {round(stats["p50"] * 1e6, 1)}  p95: {round(stats["p95"] * 1e6, 1)}  '
+          f'p99: {round(stats["p99"] * 1e6, 1)}  max: {round(stats["max"] * 1e6, 1)}')
+    print(f'Peak memory: {"n/a" if mem is None else f"{round(mem / 1024 / 1024, 1)} MB"}')
@@ -0,0 +1,357 @@
+"""
+Журнал автосохранения: полный снимок игры (savefile) плюс дописываемый лог ввода игрока.
+
+Движок игры определяется своим состоянием (вместе с генератором случайных чисел) и вводом, так что после
+снимка достаточно писать в лог повороты, шаги и действия с препятствиями - по байту на событие. Сохранение
+сводится к дозаписи накопленного с прошлого раза, fsync - не чаще раза в config.AutosaveInterval.
+Восстановление - загрузка снимка и повтор лога поверх него.
+
+Снимок можно писать в фоне (writer.Writer): снимок движка берется сразу, а файлы пишутся в другом потоке. Пока
+они не записаны, на диске остаются прежние снимок и лог, и записи продолжают дописываться в прежний лог (с
+fsync, как обычно) - по нему игра восстанавливается полностью. Записи после нового снимка заодно копятся в
+памяти, и когда его файлы записались, прежний лог сбрасывается на диск и закрывается, а они уходят в новый.
+Если записать снимок не удалось, это сообщает sync() (исключением), а журнал продолжает прежний лог до
+следующего снимка.
+
+Лог лежит рядом со снимком (<имя снимка>.log): сигнатура LOG_MAGIC, номер поколения (uint64), далее записи.
+Номер поколения пишется и в заголовок снимка, лог с чужим номером (например, не успели заменить после
+нового снимка) не применяется. Недописанная последняя запись отбрасывается.
+"""
+
+import os
+import json
+import random
+import struct
+
+from . import savefile, headless, config, utils
+
+LOG_MAGIC = b'SNAKELOG'
+
+OP_TICK = 0
+OP_UP = 1
+OP_DOWN = 2
+OP_LEFT = 3
+OP_RIGHT = 4
+OP_BARRIERS = 5  # + кол-во проходов (uint8)
+OP_REMOVE_BARRIERS = 6
+OP_HEADER = 7  # + длина (uint32) и JSON с изменившимися полями заголовка
+
+_TURN_OPS = {
+    (-1, 0): OP_UP,
+    (1, 0): OP_DOWN,
+    (0, -1): OP_LEFT,
+    (0, 1): OP_RIGHT
+}
+_TURNS = {op: direct for direct, op in _TURN_OPS.items()}
+
+_GENERATION = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+
+# сколько байт копить в памяти, прежде чем отдать их ОС (без fsync)
+_BUFFER_SIZE = 64 * 1024
+
+
+class InputLog(object):
+    """
+    Запись действий с игрой в байты лога (см. OP_*). Подключается к движку через Engine.add_recorder().
+    Наследники решают, куда девать записи, переопределяя _write()
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._ticks = 0
+
+    def turn(self, direct):
+        self._write(bytes((_TURN_OPS[tuple(direct)],)))
+
+    def tick(self):
+        self._ticks += 1
+        self._write(bytes((OP_TICK,)))
+
+    def barriers(self, n_passes):
+        self._write(bytes((OP_BARRIERS, min(n_passes, 255))))
+
+    def remove_barriers(self):
+        self._write(bytes((OP_REMOVE_BARRIERS,)))
+
+    def header_changes(self, changes):
+        data = json.dumps(changes).encode('utf-8')
+        self._write(bytes((OP_HEADER,)) + _LENGTH.pack(len(data)) + data)
+
+    def _write(self, record):
+        self._buf += record
+
+
+class Journal(InputLog):
+    """ Журнал автосохранения одной игры """
+
+    def __init__(self, file_name, snapshot_ticks=config.JournalSnapshotTicks, writer=None):
+        super(Journal, self).__init__()
+        self.file_name = file_name
+        self.log_name = file_name + '.log'
+        self.snapshot_ticks = snapshot_ticks
+        self._writer = writer
+        self._game = None
+        self._header = None
+        self._generation = None
+        # поколение, снимок и пустой лог которого уже на диске - в такой лог можно дописывать
+        self._written = None
+        # открытый лог и его поколение: пока снимок нового поколения пишется - прежний
+        self._log = None
+        self._log_generation = None
+        # записи после снимка, который еще не записан на диск - для лога его поколения
+        self._pending = bytearray()
+        # ошибка записи снимка в фоне, sync() о ней сообщает
+        self._failed = None
+        self._dirty = False
+
+    def attached(self):
+        return self._game is not None
+
+    def attach(self, game, header):
+        """ Начать журнал игры game с заголовком header (dict): полный снимок и пустой лог """
+        self.detach()
+        self._game = game
+        self._header = dict(header)
+        game.add_recorder(self)
+        self.snapshot()
+
+    def detach(self):
+        """ отключиться от игры, лог сбрасывается на диск """
+        if self._game is None:
+            return
+
+        self._game.remove_recorder(self)
+
+        if self._pending and self._writer:
+            # пока снимок пишется, записи после него - только в памяти и в прежнем логе
+            self._writer.wait(config.SaveWaitTimeout)
+
+        try:
+            self.sync()
+        finally:
+            self._close_log()
+            self._game = None
+
+    def discard(self):
+        """ отключиться от игры и удалить снимок с логом (игра закончилась) """
+        if self._game is None:
+            return
+
+        self._buf.clear()
+        self._pending.clear()
+        self.detach()
+        # после снимков, которые еще пишутся
+        self._run(self._remove_files)
+
+    def snapshot(self):
+        """
+        Полный снимок игры. Старый снимок подменяется атомарно, лог начинается заново под новым поколением -
+        когда снимок записан, а до тех пор записи идут и в прежний лог
+        """
+
+        generation = random.getrandbits(63)
+
+        with self._game.locked():
+            data = self._game.snapshot(pack=self._writer is None)
+            # записи до снимка - еще в старый лог
+            self._flush()
+            self._generation = generation
+            self._pending.clear()
+            self._ticks = 0
+
+        self._run(self._write_snapshot, dict(self._header, journal=generation), data, generation)
+        self._check_failed()
+
+    def sync(self):
+        """
+        Сбросить накопленное на диск (с fsync). Если лог стал длинным - вместо этого новый полный снимок.
+        Вызывается периодически, раз в config.AutosaveInterval
+        """
+
+        if self._game is None:
+            return
+
+        if self.snapshot_ticks and self._ticks >= self.snapshot_ticks:
+            self.snapshot()
+
+        self._flush()
+
+        if self._dirty:
+            os.fsync(self._log.fileno())
+            self._dirty = False
+
+        self._check_failed()
+
+    def header(self, **changes):
+        """ изменить поля заголовка (например, скорость игры) """
+        if self._game is None:
+            return
+
+        self._header.update(changes)
+        self.header_changes(changes)
+
+    def _run(self, func, *args):
+        if self._writer:
+            self._writer.submit(func, *args)
+        else:
+            func(*args)
+
+    def _write_snapshot(self, header, data, generation):
+        try:
+            savefile.save_snapshot(self.file_name, header, data)
+
+            with utils.atomic_write(self.log_name) as f:
+                f.write(LOG_MAGIC)
+                f.write(_GENERATION.pack(generation))
+        except Exception as e:
+            # снимок и лог на диске - прежние, и прежний лог продолжается
+            self._failed = e
+            return
+
+        self._written = generation
+
+    def _check_failed(self):
+        error, self._failed = self._failed, None
+
+        if error is not None:
+            raise Exception(f'Не удалось записать снимок автосохранения: {error}')
+
+    def _close_log(self):
+        """ сбросить на диск и закрыть открытый лог """
+        if self._log is None:
+            return
+
+        if self._dirty:
+            os.fsync(self._log.fileno())
+            self._dirty = False
+
+        self._log.close()
+        self._log = None
+        self._log_generation = None
+
+    def _remove_files(self):
+        for fn in (self.file_name, self.log_name):
+            if os.path.exists(fn):
+                os.unlink(fn)
+
+    def _write(self, record):
+        self._buf += record
+
+        if self._log_generation != self._generation:
+            self._pending += record
+
+        if len(self._buf) >= _BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._game is not None and self._log_generation != self._generation and \
+                self._written == self._generation:
+            # снимок нового поколения записался: прежний лог больше не нужен, записи после снимка - в новый
+            self._close_log()
+            self._log = open(self.log_name, 'ab')
+            self._log_generation = self._generation
+            self._buf[:] = self._pending
+            self._pending.clear()
+
+        if self._buf and self._log:
+            self._log.write(self._buf)
+            self._log.flush()
+            self._buf.clear()
+            self._dirty = True
+        elif self._log is None:
+            # лога на диске еще нет (первый снимок игры пишется) - все записи есть в _pending
+            self._buf.clear()
+
+
+def recover(file_name, grid=None, progress=None):
+    """
+    Загрузить игру из снимка и повторить поверх него лог журнала (если он есть и относится к этому снимку).
+    Подходит и для обычных сохранений - у них лога нет.
+    Если по логу игра закончилась - StopGameException
+
+    :param progress: функция(доля от 0 до 1) - сколько загружено, по байтам снимка и лога
+    :return: tuple: (заголовок - dict, движок - engine.Engine)
+    """
+
+    header, game = savefile.load(file_name, grid=grid)
+    generation = header.pop('journal', None)
+
+    if generation is None or not os.path.exists(file_name + '.log'):
+        return header, game
+
+    with open(file_name + '.log', 'rb') as f:
+        data = f.read()
+
+    pos = len(LOG_MAGIC) + _GENERATION.size
+
+    if len(data) < pos or data[:len(LOG_MAGIC)] != LOG_MAGIC or \
+            _GENERATION.unpack_from(data, len(LOG_MAGIC))[0] != generation:
+        return header, game
+
+    if progress:
+        done = os.path.getsize(file_name)
+        total = done + len(data)
+        progress(done / total)
+        replay(game, data, pos, header, progress=lambda p: progress((done + p * len(data)) / total))
+    else:
+        replay(game, data, pos, header)
+
+    return header, game
+
+
+def replay(game, data, pos=0, header=None, progress=None):
+    """
+    Повторить записи лога data начиная с pos на движке game, изменения заголовка - в header.
+    progress - функция(доля лога от 0 до 1), вызывается через каждые _BUFFER_SIZE байт лога
+    """
+
+    report = pos + _BUFFER_SIZE
+
+    while pos < len(data):
+        pos, op = apply(game, data, pos, header)
+
+        if op is None:
+            break
+
+        if progress and pos >= report:
+            progress(pos / len(data))
+            report = pos + _BUFFER_SIZE
+
+
+def apply(game, data, pos, header=None):
+    """
+    Применить к движку game одну запись лога data с позиции pos
+
+    :return: tuple: (позиция следующей записи, код записи OP_* или None - если запись оборвана)
+    """
+
+    op = data[pos]
+    pos += 1
+
+    if op == OP_TICK:
+        game.move()
+    elif op in _TURNS:
+        headless.turn(game, _TURNS[op])
+    elif op == OP_BARRIERS:
+        if pos >= len(data):
+            return pos, None
+        game.create_barriers(data[pos])
+        pos += 1
+    elif op == OP_REMOVE_BARRIERS:
+        game.remove_barriers()
+    elif op == OP_HEADER:
+        if pos + _LENGTH.size > len(data):
+            return pos, None
+        size, = _LENGTH.unpack_from(data, pos)
+        pos += _LENGTH.size
+
+        if pos + size > len(data):
+            return pos, None
+        if header is not None:
+            header.update(json.loads(bytes(data[pos:pos + size]).decode('utf-8')))
+        pos += size
+    else:
+        raise Exception(f'Лог действий поврежден: неизвестная запись {op}!')
+
+    return pos, op
@@ -0,0 +1,244 @@
+"""
+Расстановка препятствий на поле, после которой все свободные клетки остаются достижимы от головы.
+
+Препятствия - короткие прямые линии (как и раньше, от 1 до 6 клеток), все начальные клетки линий выбираются
+сразу, одной выборкой из индекса пустых клеток. Линия идет только по пустым клеткам: еду и удавчика не
+закрывает, и перед головой (головами, если удавчиков несколько) оставляется config.BarrierHeadClearance клеток.
+
+Связность проверяется системой непересекающихся множеств (union-find) не по клеткам, а по отрезкам строк
+из проходимых клеток: их немного больше, чем строк поля и препятствий, так что проверка быстрая и на больших
+полях. Тело удавчика проходимо (оно уйдет), старые препятствия - нет. Если новые препятствия отрезали часть
+поля, убираются те из них, что разделяют разные части ("двери"), а если одной клетки мало (стена толще) -
+убираются клетки, примыкающие к отрезанным частям, пока все части не соединятся.
+"""
+
+import re
+import bisect
+
+from . import config
+
+_RUN = re.compile(b'\x01+')
+
+
+class _Runs(object):
+    """ Отрезки строк из проходимых клеток и union-find над ними. Узлы отрезков строки идут подряд с _first[top] """
+
+    def __init__(self, mask, width, height):
+        self._starts = []
+        self._ends = []
+        self._first = []
+        self.parent = []
+        # кол-во множеств (связных частей поля)
+        self.count = 0
+
+        for top in range(height):
+            row = top * width
+            spans = [m.span() for m in _RUN.finditer(mask, row, row + width)]
+            self._first.append(len(self.parent))
+            self._starts.append([start - row for start, _ in spans])
+            self._ends.append([end - row for _, end in spans])
+            self.parent.extend(range(len(self.parent), len(self.parent) + len(spans)))
+            self.count += len(spans)
+
+            if top:
+                self._join_rows(top - 1, top)
+
+    def _join_rows(self, upper, lower):
+        """ объединить пересекающиеся отрезки соседних строк (соседство - по стороне клетки) """
+        us, ue, ls, le = self._starts[upper], self._ends[upper], self._starts[lower], self._ends[lower]
+        uf, lf = self._first[upper], self._first[lower]
+        i = j = 0
+
+        while i < len(us) and j < len(ls):
+            if us[i] < le[j] and ls[j] < ue[i]:
+                self.union(uf + i, lf + j)
+
+            if ue[i] <= le[j]:
+                i += 1
+            else:
+                j += 1
+
+    def add(self):
+        """ новый узел (например, убранное препятствие) """
+        self.parent.append(len(self.parent))
+        self.count += 1
+        return len(self.parent) - 1
+
+    def find(self, x):
+        parent = self.parent
+
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+
+        if a != b:
+            self.parent[b] = a
+            self.count -= 1
+
+        return a
+
+    def cut_off(self, main):
+        """ отрезки не из множества main: (top, начало, конец) """
+        for top, first in enumerate(self._first):
+            for i, start in enumerate(self._starts[top]):
+                if self.find(first + i) != main:
+                    yield top, start, self._ends[top][i]
+
+    def run(self, top, left):
+        """ узел отрезка с клеткой (top, left), клетка должна быть проходимой """
+        return self._first[top] + bisect.bisect_right(self._starts[top], left) - 1
+
+
+def generate(rnd, area, width, height, empty, heads, n_passes):
+    """
+    Новые препятствия для поля
+
+    :param rnd: генератор случайных чисел движка
+    :param area: bytes: поле, по байту на клетку, построчно (Engine.area_bytes())
+    :param empty: CellSet пустых клеток
+    :param heads: головы удавчиков: [(номер клетки, направление движения (top, left)), ...]. Связность
+        проверяется от первой, пустой список - без проверки
+    :param n_passes: кол-во проходов, за проход - до (ширина * высота / 100) линий
+    :return: list: [(номер клетки, тип фигуры), ...]
+    """
+
+    size = width * height
+    lines = sum(rnd.randint(0, size // 100) for _ in range(n_passes))
+    seeds = [empty.item(i) for i in rnd.sample(range(len(empty)), min(lines, len(empty)))]
+
+    # проходимые клетки: все, кроме препятствий
+    table = bytes(0 if cell_type in config.AreaTypes[config.FIELD_GROUP_BARRIER] else 1 for cell_type in range(256))
+    mask = bytearray(area.translate(table))
+    reserved = set()
+
+    for head, direct in heads:
+        top, left = divmod(head, width)
+
+        for i in range(1, config.BarrierHeadClearance + 1):
+            t, l = top + direct[0] * i, left + direct[1] * i
+
+            if 0 <= t < height and 0 <= l < width:
+                reserved.add(t * width + l)
+
+    placed = []
+
+    for cell in seeds:
+        of_top = rnd.choice((-1, 0, 1))
+        of_left = rnd.choice((-1, 0, 1))
+        el_type = rnd.choice(config.AreaTypes[config.FIELD_GROUP_BARRIER])
+        top, left = divmod(cell, width)
+
+        for i in range(rnd.randint(1, 6)):
+            t, l = top + of_top * i, left + of_left * i
+
+            if t < 0 or t >= height or l < 0 or l >= width:
+                break
+
+            c = t * width + l
+
+            if area[c] != config.FIELD_TYPE_NONE or c in reserved:
+                break
+            if mask[c]:
+                mask[c] = 0
+                placed.append((c, el_type))
+
+    if not heads or not placed:
+        return placed
+
+    return _connect(mask, width, height, heads[0][0], placed)
+
+
+def _connect(mask, width, height, head, placed):
+    """ убрать из placed препятствия, без которых не все проходимые клетки достижимы от головы """
+    runs = _Runs(mask, width, height)
+    opened = {}
+
+    def node(cell):
+        if mask[cell]:
+            return runs.run(*divmod(cell, width))
+
+        return opened.get(cell)
+
+    def neighbours(cell):
+        top, left = divmod(cell, width)
+        res = set()
+
+        for t, l in ((top - 1, left), (top + 1, left), (top, left - 1), (top, left + 1)):
+            if 0 <= t < height and 0 <= l < width:
+                n = node(t * width + l)
+
+                if n is not None:
+                    res.add(runs.find(n))
+
+        return res
+
+    closed = set(cell for cell, _ in placed)
+    # препятствия, которые могут мешать связности: только те, что примыкают к отрезанным частям поля
+    candidates = []
+
+    def add_candidates(cells):
+        for cell in cells:
+            if cell in closed:
+                closed.discard(cell)
+                candidates.append(cell)
+
+    def around(top, start, end):
+        """ клетки вокруг отрезка строки [start, end) """
+        row = top * width
+
+        if start > 0:
+            yield row + start - 1
+        if end < width:
+            yield row + end
+
+        for t in (top - 1, top + 1):
+            if 0 <= t < height:
+                yield from range(t * width + start, t * width + end)
+
+    def open_cell(cell, roots):
+        n = opened[cell] = runs.add()
+
+        for root in roots:
+            runs.union(n, root)
+
+        # соседние препятствия теперь примыкают к той же части поля
+        add_candidates(around(cell // width, cell % width, cell % width + 1))
+
+    if runs.count > 1:
+        for top, start, end in runs.cut_off(runs.find(node(head))):
+            add_candidates(around(top, start, end))
+
+    while runs.count > 1:
+        progress = False
+
+        # двери: препятствие между разными частями поля
+        for cell in candidates:
+            if cell not in opened:
+                roots = neighbours(cell)
+
+                if len(roots) > 1:
+                    open_cell(cell, roots)
+                    progress = True
+
+        if runs.count == 1:
+            break
+
+        # стена толще клетки: отрезанные части растут на клетку в сторону препятствий
+        for cell in list(candidates):
+            if cell not in opened:
+                roots = neighbours(cell)
+
+                if roots and roots != {runs.find(node(head))}:
+                    open_cell(cell, roots)
+                    progress = True
+
+        if not progress:
+            # части, отрезанные старыми препятствиями, новыми не соединить
+            break
+
+    return [(cell, el_type) for cell, el_type in placed if cell not in opened]
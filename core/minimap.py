@@ -0,0 +1,68 @@
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QImage, QColor
+
+from . import palette, config
+
+
+class Minimap(object):
+    """
+    Уменьшенная карта всего поля для больших полей, где в окне видна только его часть.
+    Поле хранится картинкой с палитрой, пиксель на клетку, цвет - тип фигуры. Картинка строится целиком только
+    при смене поля, дальше в ней меняются только изменившиеся клетки. На экран она выводится масштабированной
+    до config.MinimapSize, так что цена отрисовки от размера поля не зависит
+    """
+
+    def __init__(self):
+        self._image = None
+        self._game = None
+        self._colors = [0xff000000 | palette.hex_to_rgb(color if sq_type != config.FIELD_TYPE_BODY else color[0])
+                        for sq_type, color in sorted(config.Colors.items())]
+
+    def invalidate(self):
+        self._image = None
+        self._game = None
+
+    def attach(self, game):
+        """ карта поля движка game: если она строилась для другого движка (или сброшена) - строится заново """
+        if self._image is None or game is not self._game:
+            self.rebuild(game)
+
+    def rebuild(self, game):
+        """ построить карту поля заново """
+        self._game = game
+        h, w = game.size()
+        # bytes живут только до copy(), своей памяти у такой картинки нет
+        data = game.area_bytes()
+        self._image = QImage(data, w, h, w, QImage.Format_Indexed8).copy()
+        self._image.setColorTable(self._colors)
+
+    def update_cells(self, game, cells):
+        """ перенести на карту изменившиеся клетки cells: [(top, left), ...] """
+        self.attach(game)
+
+        for top, left in cells:
+            self._image.setPixel(left, top, int(game.cell(top, left)))
+
+    def rect(self, area):
+        """ где рисовать карту: в правом верхнем углу прямоугольника area (поле), с сохранением пропорций """
+        if self._image is None:
+            return QRect()
+
+        scale = min(config.MinimapSize / self._image.width(), config.MinimapSize / self._image.height())
+        w, h = max(1, int(self._image.width() * scale)), max(1, int(self._image.height() * scale))
+        return QRect(area.right() - w - config.MinimapMargin, area.top() + config.MinimapMargin, w, h)
+
+    def draw(self, painter, rect, view):
+        """ нарисовать карту в rect и рамку видимой части поля view: (top, left, высота, ширина) в клетках """
+        if self._image is None:
+            return
+
+        painter.drawImage(rect, self._image)
+
+        sx, sy = rect.width() / self._image.width(), rect.height() / self._image.height()
+        top, left, rows, cols = view
+        painter.setPen(QColor(Qt.white))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(rect)
+        painter.drawRect(QRect(rect.left() + int(left * sx), rect.top() + int(top * sy),
+                               max(1, int(cols * sx)), max(1, int(rows * sy))))
@@ -0,0 +1,129 @@
+import os
+import array
+import colorsys
+import collections
+
+from . import utils, config
+
+_palettes = collections.OrderedDict()
+# досчитанные, но еще не сохраненные на диск градиенты (вытесненные из _palettes - тоже)
+_dirty = set()
+
+
+def hex_to_rgb(color):
+    """ '#rrggbb' -> 0xRRGGBB """
+    return int(color[1:], 16)
+
+
+def get_palette(color_from, color_to, size, disk_cache=None):
+    """
+    Градиент между двумя цветами. Последние config.PaletteCacheSize градиентов держатся в памяти (LRU),
+    так что один и тот же градиент не строится заново
+    """
+
+    key = (color_from.lower(), color_to.lower(), size)
+    palette = _palettes.get(key)
+
+    if palette is None:
+        palette = _palettes[key] = Palette(color_from, color_to, size,
+                                           disk_cache=config.PaletteDiskCache if disk_cache is None else disk_cache)
+
+        if len(_palettes) > config.PaletteCacheSize:
+            _palettes.popitem(last=False)
+    else:
+        _palettes.move_to_end(key)
+
+    return palette
+
+
+def flush():
+    """ сохранить на диск досчитанные градиенты. Пишет файлы - вызывать в фоне (writer.Writer) или на выходе """
+    while _dirty:
+        _dirty.pop().save()
+
+
+class Palette(object):
+    """
+    Градиент из size цветов, упакованных в int (0xRRGGBB).
+    Цвета интерполируются в пространстве HSL, как в colour.Color.range_to. Считаются лениво - по мере того, как
+    запрашиваются все более дальние индексы (т.е. по мере роста удавчика), и могут сохраняться в профиль.
+    Досчитываются они при отрисовке, поэтому сами на диск не пишутся - только через flush()
+    """
+
+    def __init__(self, color_from, color_to, size, disk_cache=False):
+        self._size = size
+        self._colors = array.array('I')
+        self._file = None
+
+        r, g, b = [v / 255 for v in _split_rgb(hex_to_rgb(color_from))]
+        self._hls_from = colorsys.rgb_to_hls(r, g, b)
+        r, g, b = [v / 255 for v in _split_rgb(hex_to_rgb(color_to))]
+        hls_to = colorsys.rgb_to_hls(r, g, b)
+        steps = size - 1
+        self._hls_step = tuple((hls_to[i] - self._hls_from[i]) / steps if steps > 0 else 0 for i in range(3))
+
+        if disk_cache:
+            self._file = os.path.join(utils.get_profile_dir(), 'palette',
+                                      f'{color_from[1:].lower()}_{color_to[1:].lower()}_{size}.bin')
+            self._load()
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._size
+
+        if not 0 <= i < self._size:
+            raise IndexError('Palette index out of range')
+
+        if i >= len(self._colors):
+            # досчитываем с запасом, чтобы не расширять массив на каждом шаге удавчика
+            self._extend(min(max(i + 1, len(self._colors) * 2, 64), self._size))
+
+        return self._colors[i]
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def _color(self, i):
+        h, l, s = (self._hls_from[j] + self._hls_step[j] * i for j in range(3))
+        r, g, b = colorsys.hls_to_rgb(h, l, s)
+        return (int(r * 255 + 0.5) << 16) | (int(g * 255 + 0.5) << 8) | int(b * 255 + 0.5)
+
+    def _extend(self, n):
+        self._colors.extend(self._color(i) for i in range(len(self._colors), n))
+
+        if self._file:
+            _dirty.add(self)
+
+    def _load(self):
+        try:
+            with open(self._file, 'rb') as f:
+                data = f.read()
+
+            self._colors.frombytes(data[:len(data) - len(data) % self._colors.itemsize])
+            del self._colors[self._size:]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f'{e}')
+
+    def save(self):
+        if not self._file:
+            return
+
+        data = self._colors.tobytes()
+
+        try:
+            os.makedirs(os.path.dirname(self._file), exist_ok=True)
+
+            with open(self._file, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            print(f'{e}')
+
+
+def _split_rgb(rgb):
+    return (rgb >> 16) & 0xff, (rgb >> 8) & 0xff, rgb & 0xff
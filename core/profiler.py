@@ -0,0 +1,168 @@
+"""
+Замеры времени работы частей игры: шаг движка, появление еды, отрисовка, сохранение и загрузка.
+
+По каждому замеру хранятся последние config.ProfileWindow значений (по ним считаются p50/p95/max), общее
+кол-во замеров и сколько из них не уложились в отведенное время (например, шаг игры - в интервал между
+шагами). Замеры включаются enable(), пока они выключены, measure() отдает пустой контекст и больше ничего
+не делает. В горячих местах движка и этого много, там сначала проверяется profiler.enabled.
+Замеры добавляются и из других потоков (сохранение в фоне), поэтому замеры части игры меняются и читаются
+под ее блокировкой.
+
+    with profiler.measure('paint', deadline=self.speed):
+        ...
+"""
+
+import json
+import time
+import threading
+import collections
+
+from . import config
+
+enabled = False
+_sections = collections.OrderedDict()
+# новые части игры могут появиться одновременно в разных потоках
+_sections_lock = threading.Lock()
+
+
+class Section(object):
+    """ Замеры одной части игры """
+
+    def __init__(self, window):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+        self.missed = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, duration, deadline=None):
+        """ duration - секунды, deadline - за сколько миллисекунд надо было уложиться (None - не важно) """
+        with self._lock:
+            self.samples.append(duration)
+            self.count += 1
+            self.total += duration
+
+            if deadline is not None and duration * 1000 > deadline:
+                self.missed += 1
+
+    def copy_samples(self):
+        """ копия последних замеров: list """
+        with self._lock:
+            return list(self.samples)
+
+    def summary(self):
+        """ сводка в миллисекундах: dict """
+        with self._lock:
+            samples = list(self.samples)
+            count, missed, total = self.count, self.missed, self.total
+
+        samples.sort()
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3) if samples else 0.0
+
+        return {
+            'count': count,
+            'missed': missed,
+            'avg': round(total / count * 1000, 3) if count else 0.0,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': round(samples[-1] * 1000, 3) if samples else 0.0
+        }
+
+
+class _Measure(object):
+
+    __slots__ = ('_name', '_deadline', '_started')
+
+    def __init__(self, name, deadline):
+        self._name = name
+        self._deadline = deadline
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        add(self._name, time.perf_counter() - self._started, self._deadline)
+        return False
+
+
+class _NoMeasure(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NO_MEASURE = _NoMeasure()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    _sections.clear()
+
+
+def measure(name, deadline=None):
+    """ контекст для замера времени части игры name, deadline - за сколько мс надо уложиться """
+    if not enabled:
+        return _NO_MEASURE
+
+    return _Measure(name, deadline)
+
+
+def add(name, duration, deadline=None):
+    """ добавить замер вручную: duration - секунды, deadline - мс """
+    if not enabled:
+        return
+
+    section = _sections.get(name)
+
+    if section is None:
+        with _sections_lock:
+            section = _sections.get(name)
+
+            if section is None:
+                section = _sections[name] = Section(config.ProfileWindow)
+
+    section.add(duration, deadline)
+
+
+def report():
+    """ сводка по всем замерам: {часть игры: dict, как Section.summary()} """
+    # замеры могут добавляться и из других потоков (сохранение в фоне)
+    return {name: section.summary() for name, section in list(_sections.items())}
+
+
+def print_report():
+    print('-= Profile =-')
+
+    if not enabled:
+        print('Profiling: OFF')
+        return
+
+    for name, st in report().items():
+        print(f'{name}: count: {st["count"]}  avg: {st["avg"]} ms  p50: {st["p50"]} ms  p95: {st["p95"]} ms  '
+              f'max: {st["max"]} ms  missed: {st["missed"]}')
+
+
+def dump(file_name):
+    """ записать сводку и последние замеры в JSON (для разбора потом) """
+    data = {
+        'time': time.time(),
+        'window': config.ProfileWindow,
+        'sections': {name: dict(section.summary(), samples=[round(s * 1000, 3) for s in section.copy_samples()])
+                     for name, section in list(_sections.items())}
+    }
+
+    with open(file_name, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,261 @@
+"""
+Запись и воспроизведение игр.
+
+Движок определяется начальным значением генератора случайных чисел и вводом игрока, так что запись игры -
+это seed и лог действий (см. journal.OP_*), по байту на шаг/поворот. Файл повтора: сигнатура MAGIC, версия
+формата (uint16), далее блоки, как в savefile:
+
+    HEAD - JSON: параметры движка (Engine.settings()), seed, кол-во проходов расстановки препятствий,
+           интервал появления еды, сложность, скорость
+    KEYF - ключевой кадр: номер шага и позиция в логе (uint64, uint64), далее игра в формате savefile.
+           Кадры снимаются раз в config.ReplayKeyframeTicks шагов и нужны для перемотки. Если запись начата
+           не с начала игры (например, после загрузки), первый кадр - на шаге 0. Длинная запись хранит не
+           больше config.ReplayMaxKeyframes кадров: старые прореживаются, шаг между кадрами растет
+    INPT - лог действий
+    END  - JSON: чем закончилась запись: шагов, длина удавчика, причина окончания (None - игра не закончена)
+"""
+
+import io
+import json
+import time
+import struct
+
+from . import engine, journal, savefile, utils, config
+
+MAGIC = b'SNAKEREP'
+VERSION = 1
+
+_KEYFRAME = struct.Struct('<QQ')
+
+
+class Recorder(journal.InputLog):
+    """ Запись игры. Подключается к движку сразу после старта игры (seed) или загрузки (seed=None) """
+
+    def __init__(self, game, header=None, seed=None, keyframe_ticks=config.ReplayKeyframeTicks):
+        super(Recorder, self).__init__()
+        self.keyframe_ticks = keyframe_ticks
+        self._game = game
+        self._header = game.settings()
+        self._header.update({
+            'seed': seed,
+            'barriers': game.difficulty['Barriers'],
+            'eats_interval': game.eats_interval
+        })
+        self._header.update(header or {})
+        # изменения заголовка по ходу игры (скорость), попадают в ключевые кадры
+        self._state = {}
+        # [(шаг, позиция в логе, заголовок, быстрый снимок Engine.snapshot(pack=False)), ...]
+        self._keyframes = []
+        self._result = None
+
+        with game.locked():
+            if seed is None:
+                self._keyframe()
+
+            game.add_recorder(self)
+
+    def tick(self):
+        if self.keyframe_ticks and self._ticks and self._ticks % self.keyframe_ticks == 0:
+            self._keyframe()
+
+        super(Recorder, self).tick()
+
+    def header_changes(self, changes):
+        self._state.update(changes)
+        super(Recorder, self).header_changes(changes)
+
+    def stop(self, reason=None):
+        """ закончить запись, reason - причина окончания игры из config.StopReasons """
+        self._game.remove_recorder(self)
+        self._result = self._current_result(reason)
+
+    def save(self, file_name):
+        """ записать повтор в файл (запись можно и не заканчивать) """
+        with self._game.locked():
+            result = self._result or self._current_result(None)
+            log = bytes(self._buf)
+            keyframes = list(self._keyframes)
+
+        with utils.atomic_write(file_name) as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<H', VERSION))
+            savefile.write_chunk(f, b'HEAD', json.dumps(self._header).encode('utf-8'))
+
+            for tick, pos, state, data in keyframes:
+                frame = io.BytesIO()
+                savefile.write_snapshot(frame, state, data)
+                savefile.write_chunk(f, b'KEYF', _KEYFRAME.pack(tick, pos) + frame.getvalue())
+
+            savefile.write_chunk(f, b'INPT', log)
+            savefile.write_chunk(f, b'END ', json.dumps(result).encode('utf-8'))
+
+    def _current_result(self, reason):
+        return {'ticks': self._ticks, 'length': self._game.length(), 'reason': reason}
+
+    def _keyframe(self):
+        # под блокировкой игры только быстрый снимок, в формат файла кадры переводятся при сохранении
+        self._keyframes.append((self._ticks, len(self._buf), dict(self._state), self._game.snapshot(pack=False)))
+
+        if len(self._keyframes) > config.ReplayMaxKeyframes:
+            # память записи ограничена: оставляем каждый второй кадр (и кадр на шаге 0), дальше - реже
+            self.keyframe_ticks *= 2
+            self._keyframes = [frame for frame in self._keyframes if frame[0] % self.keyframe_ticks == 0]
+
+
+class Player(object):
+    """
+    Воспроизведение записи: step() - шаг вперед, seek() - перемотка на любой шаг.
+    Текущее состояние игры - в game (после перемотки это может быть другой движок), заголовок с учетом
+    изменений по ходу игры (скорость) - в header
+    """
+
+    def __init__(self, file_name, grid=None):
+        with open(file_name, 'rb') as f:
+            raw = f.read()
+
+        self._grid = grid
+        self._initial = {}
+        self._keyframes = []
+        self._log = b''
+        self.result = None
+
+        for tag, data in savefile.iter_chunks(raw, MAGIC, VERSION):
+            if tag == b'HEAD':
+                self._initial = json.loads(bytes(data).decode('utf-8'))
+            elif tag == b'KEYF':
+                tick, pos = _KEYFRAME.unpack_from(data)
+                self._keyframes.append((tick, pos, data[_KEYFRAME.size:]))
+            elif tag == b'INPT':
+                self._log = data
+            elif tag == b'END ':
+                self.result = json.loads(bytes(data).decode('utf-8'))
+
+        if self._initial.get('seed') is None and not self._keyframes:
+            raise Exception('В записи нет ни начального значения, ни начального кадра!')
+
+        self.header = None
+        self.game = None
+        self.ticks = 0
+        self._pos = 0
+        self.seek(0)
+
+    def total_ticks(self):
+        """ сколько шагов в записи, None - если неизвестно """
+        return self.result['ticks'] if self.result else None
+
+    def finished(self):
+        return self._pos >= len(self._log)
+
+    def seek(self, tick):
+        """ перейти к шагу tick: от ближайшего ключевого кадра до него, дальше - по логу """
+        frames = [frame for frame in self._keyframes if frame[0] <= tick]
+
+        if frames:
+            self.ticks, self._pos, data = frames[-1]
+            state, self.game = savefile.parse(data, grid=self._grid)
+            self.header = dict(self._initial, **state)
+            self.game.difficulty = self._difficulty()
+            self.game.eats_interval = self._initial['eats_interval']
+        else:
+            self.ticks, self._pos = 0, 0
+            self.header = dict(self._initial)
+            self.game = self._new_game()
+
+        while self.ticks < tick and self.step():
+            pass
+
+    def step(self):
+        """
+        Шаг записи со всеми действиями перед ним.
+        Если на этом шаге игра закончилась - StopGameException, как у движка
+
+        :return: bool: False - запись кончилась
+        """
+
+        while self._pos < len(self._log):
+            if self._log[self._pos] == journal.OP_TICK:
+                self._pos += 1
+                self.ticks += 1
+                self.game.move()
+                return True
+
+            self._pos, op = journal.apply(self.game, self._log, self._pos, self.header)
+
+            if op is None:
+                break
+
+        return False
+
+    def run(self):
+        """ доиграть запись до конца с максимальной скоростью: dict, как result """
+        reason = None
+
+        try:
+            while self.step():
+                pass
+        except engine.StopGameException as e:
+            reason = e.reason
+
+        return {'ticks': self.ticks, 'length': self.game.length(), 'reason': reason}
+
+    def _difficulty(self):
+        return dict(config.Difficultys[self._initial.get('difficulty', config.DIFF_EASY)],
+                    Barriers=self._initial['barriers'])
+
+    def _new_game(self):
+        h = self._initial
+        game = engine.Engine(h['width'], h['height'], boa_size=h['initial_boa_size'], arrange_mech=h['arrange_mech'],
+                             move_mech=h['move_mech'], grid=h['grid'] if self._grid is None else self._grid,
+                             seed=h['seed'], barrier_mech=h.get('barrier_mech', config.BARRIER_MECH_LINES))
+        game.difficulty = self._difficulty()
+        # интервал появления еды - как при записи, иначе повтор разойдется с игрой
+        game.eats_interval = self._initial['eats_interval']
+        game.clear()
+        game.start()
+        return game
+
+
+def benchmark(file_names, grid=None):
+    """
+    Прогоняет записи с максимальной скоростью и сверяет результат с записанным
+
+    :return: list: статистика по каждой записи
+    """
+
+    stats = []
+
+    for fn in file_names:
+        started = time.perf_counter()
+        player = Player(fn, grid=grid)
+        load_time = time.perf_counter() - started
+        result = player.run()
+        total = time.perf_counter() - started
+
+        stats.append({
+            'file': fn,
+            'ticks': player.ticks,
+            'load_time': load_time,
+            'total_time': total,
+            'ticks_per_sec': player.ticks / (total - load_time) if total > load_time else 0.0,
+            'result': result,
+            'expected': player.result,
+            'ok': player.result is None or result == player.result
+        })
+
+    return stats
+
+
+def print_report(stats):
+    print('-= Replay =-')
+
+    for st in stats:
+        reason = st['result']['reason']
+        print(f'{st["file"]}: ticks: {st["ticks"]}  length: {st["result"]["length"]}  '
+              f'result: {"unfinished" if reason is None else config.StopReasons[reason][1]}  '
+              f'time: {round(st["total_time"], 3)} s  ticks/sec: {round(st["ticks_per_sec"])}  '
+              f'{"OK" if st["ok"] else "MISMATCH, recorded: " + str(st["expected"])}')
+
+    ticks = sum(st['ticks'] for st in stats)
+    total = sum(st['total_time'] for st in stats)
+    print(f'Total: {len(stats)} replays  ticks: {ticks}  time: {round(total, 3)} s  '
+          f'ticks/sec: {round(ticks / total) if total else 0}')
@@ -0,0 +1,129 @@
+import os
+import time
+import statistics
+import collections
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import engine, headless, config
+
+# сколько игр гоняет воркер за одно задание: результаты возвращаются пачками по мере готовности
+ChunkSize = 64
+
+
+def play(seed, spec):
+    """
+    Одна игра без отрисовки с заданным seed
+
+    :param spec: dict: параметры игры, см. run()
+    :return: tuple: (seed, длина удавчика, кол-во шагов, код результата, причина окончания).
+        Для игры, не закончившейся за max_ticks шагов, код и причина - None
+    """
+
+    game = headless.new_game(spec['width'], spec['height'], spec['length'], spec['arrange_mech'],
+                             spec['move_mech'], spec['grid'], spec['difficulty'], seed=seed,
+                             barriers=spec['barriers'], eats_interval=spec['eats_interval'])
+    policy = headless.make_policy(spec['policy'], script=spec['script'], seed=seed)
+    ticks = 0
+
+    while ticks < spec['max_ticks']:
+        policy.step(game)
+        ticks += 1
+
+        try:
+            game.move()
+        except engine.StopGameException as e:
+            return seed, game.length(), ticks, e.code, e.reason
+
+    return seed, game.length(), ticks, None, None
+
+
+def _run_chunk(seeds, spec):
+    return [play(seed, spec) for seed in seeds]
+
+
+def run(n_games, width=config.BoxWidth, height=config.BoxHeight, length=None, arrange_mech=None, move_mech=None,
+        grid=None, difficulty=config.DIFF_EASY, barriers=None, eats_interval=None, policy=headless.POLICY_RANDOM,
+        script=None, max_ticks=100000, seed=0, workers=None, on_result=None):
+    """
+    Прогоняет n_games игр с seed, seed + 1, ... на пуле процессов (по умолчанию - по процессу на ядро)
+
+    :param barriers: int: переопределить кол-во проходов расстановки препятствий для сложности difficulty
+    :param eats_interval: int: переопределить config.EatsRaiseInterval (только для этих игр)
+    :param on_result: callable: вызывается на каждый результат (см. play()) по мере поступления
+    :return: dict: сводная статистика, см. summarize()
+    """
+
+    spec = {
+        'width': width,
+        'height': height,
+        'length': length,
+        'arrange_mech': arrange_mech,
+        'move_mech': move_mech,
+        'grid': grid,
+        'difficulty': difficulty,
+        'barriers': barriers,
+        'eats_interval': eats_interval,
+        'policy': policy,
+        'script': script,
+        'max_ticks': max_ticks
+    }
+
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed, seed + n_games))
+    results = []
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_chunk, seeds[i:i + ChunkSize], spec)
+                   for i in range(0, len(seeds), ChunkSize)]
+
+        for future in as_completed(futures):
+            for res in future.result():
+                results.append(res)
+
+                if on_result:
+                    on_result(res)
+
+    stats = summarize(results)
+    stats['workers'] = workers
+    stats['total_time'] = time.perf_counter() - started
+    stats['games_per_sec'] = len(results) / stats['total_time'] if stats['total_time'] else 0.0
+    stats['ticks_per_sec'] = stats['ticks'] / stats['total_time'] if stats['total_time'] else 0.0
+    return stats
+
+
+def summarize(results):
+    """ сводная статистика по результатам игр """
+    lengths = [res[1] for res in results]
+    ticks = [res[2] for res in results]
+    codes = collections.Counter(res[3] for res in results)
+
+    return {
+        'games': len(results),
+        'wins': codes[config.WIN_CODE],
+        'loses': codes[config.LOSE_CODE],
+        'unfinished': codes[None],
+        'ticks': sum(ticks),
+        'length_mean': statistics.mean(lengths) if lengths else 0,
+        'length_median': statistics.median(lengths) if lengths else 0,
+        'length_max': max(lengths, default=0),
+        'ticks_mean': statistics.mean(ticks) if ticks else 0,
+        'ticks_median': statistics.median(ticks) if ticks else 0,
+        'reasons': collections.Counter(res[4] for res in results if res[4] is not None)
+    }
+
+
+def print_report(stats):
+    print('-= Parallel runner =-')
+    print(f'Games: {stats["games"]}  Workers: {stats["workers"]}')
+    print(f'Wins: {stats["wins"]}  Loses: {stats["loses"]}  Unfinished: {stats["unfinished"]}')
+    print(f'Length:  mean: {round(stats["length_mean"], 1)}  median: {stats["length_median"]}  '
+          f'max: {stats["length_max"]}')
+    print(f'Ticks survived:  mean: {round(stats["ticks_mean"], 1)}  median: {stats["ticks_median"]}')
+    print('Stop reasons:')
+
+    for reason, n in stats['reasons'].most_common():
+        print(f'    {config.StopReasons[reason][1]} {n}')
+
+    print(f'Total time: {round(stats["total_time"], 3)} s')
+    print(f'Games/sec: {round(stats["games_per_sec"], 1)}  Ticks/sec: {round(stats["ticks_per_sec"])}')
@@ -0,0 +1,248 @@
+"""
+Бинарный формат сохранения игры.
+
+Файл: сигнатура MAGIC, версия формата (uint16), далее блоки: тег (4 байта), длина данных (uint64), данные.
+Все числа - little-endian. Неизвестные блоки при чтении пропускаются, так что новые блоки можно добавлять,
+не меняя версию формата.
+
+    HEAD - заголовок игры в JSON (скорость, время старта, сложность)
+    META - параметры движка: ширина, высота, начальный размер, способ расстановки, способ перемещения,
+           тип матрицы, шагов до появления еды, номер головы
+    AREA - поле, по байту на клетку, построчно
+    BODY - удавчик от головы к хвосту, номера клеток (int32)
+    MOVE - смещения элементов удавчика, пары (top, left) (int8)
+    TCEL - клетки точек поворота (int32)
+    TMOV - направления в точках поворота, пары (top, left) (int8)
+    FREE - индекс пустых клеток в порядке элементов (int32)
+    FEAT - индекс клеток с едой в порядке элементов (int32)
+    RAND - состояние генератора случайных чисел движка: версия (int8), есть ли gauss_next (bool),
+           gauss_next (double), внутреннее состояние (uint32)
+    BARR - способ расстановки препятствий (int8). Нет блока - старая игра, config.BARRIER_MECH_LINES
+
+Файл пишется во временный рядом и подменяет старый через os.replace, так что при сбое во время записи
+остается прежнее сохранение.
+
+Старые сохранения (JSON-заголовок + pickle движка) читаются через load_legacy().
+"""
+
+import sys
+import json
+import mmap
+import array
+import struct
+import traceback
+
+from . import engine, utils, config
+
+MAGIC = b'SNAKESAV'
+VERSION = 1
+
+_CHUNK = struct.Struct('<4sQ')
+_META = struct.Struct('<qqqbbbxqq')
+_RAND = struct.Struct('<b?d')
+
+
+def save(file_name, header, game):
+    """ Сохраняет заголовок header (dict) и движок game в файл """
+    save_snapshot(file_name, header, game.snapshot())
+
+
+def save_snapshot(file_name, header, data):
+    """ то же по снимку движка (Engine.snapshot(), в т.ч. быстрому) - например, в другом потоке """
+    with utils.atomic_write(file_name) as f:
+        write_snapshot(f, header, data)
+
+
+def write(f, header, game):
+    """ записать сохранение в открытый двоичный файл f """
+    write_snapshot(f, header, game.snapshot())
+
+
+def write_snapshot(f, header, data):
+    data = engine.Engine.pack_snapshot(data)
+    meta = _META.pack(data['width'], data['height'], data['initial_boa_size'], data['arrange_mech'],
+                      data['move_mech'], data['grid'], data['to_rise'], data['head_serial'])
+
+    f.write(MAGIC)
+    f.write(struct.pack('<H', VERSION))
+    write_chunk(f, b'HEAD', json.dumps(header).encode('utf-8'))
+    write_chunk(f, b'META', meta)
+    write_chunk(f, b'AREA', data['area'])
+    write_chunk(f, b'BODY', pack_array(data['boa']))
+    write_chunk(f, b'MOVE', pack_array(data['moves']))
+    write_chunk(f, b'TCEL', pack_array(data['turn_cells']))
+    write_chunk(f, b'TMOV', pack_array(data['turn_moves']))
+    write_chunk(f, b'FREE', pack_array(data['free_empty']))
+    write_chunk(f, b'FEAT', pack_array(data['free_eats']))
+    write_chunk(f, b'RAND', _pack_rng(data['rng']))
+    write_chunk(f, b'BARR', struct.pack('<b', data['barrier_mech']))
+
+
+def load(file_name, grid=None):
+    """
+    Загружает сохранение (нового или старого формата)
+
+    :param grid: тип матрицы поля для загруженного движка, по умолчанию - как было при сохранении
+    :return: tuple: (заголовок - dict, движок - engine.Engine)
+    """
+
+    with open(file_name, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return load_legacy(f.read())
+
+        error = None
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            buf = memoryview(mm)
+
+            try:
+                return parse(buf, grid=grid)
+            except Exception as e:
+                # трассировка держит кадры parse/iter_chunks, а с ними и срезы буфера: отображение с живыми
+                # ссылками не закроется и вместо настоящей ошибки будет BufferError
+                _clear_frames(e)
+                error = e
+            finally:
+                buf.release()
+
+        raise error
+
+
+def _clear_frames(error):
+    """ очистить локальные переменные кадров трассировки ошибки и всех ошибок, из-за которых она возникла """
+    while error is not None:
+        traceback.clear_frames(error.__traceback__)
+        error = error.__cause__ or error.__context__
+
+
+def parse(buf, grid=None):
+    """ сохранение нового формата из буфера buf (bytes, memoryview): (заголовок, движок) """
+    chunks = {}
+    data = None
+
+    try:
+        chunks = read_chunks(buf)
+        header = json.loads(bytes(chunks[b'HEAD']).decode('utf-8'))
+        width, height, initial_boa_size, arrange_mech, move_mech, grid_type, to_rise, head_serial = \
+            _META.unpack(chunks[b'META'])
+        data = {
+            'width': width,
+            'height': height,
+            'initial_boa_size': initial_boa_size,
+            'arrange_mech': arrange_mech,
+            'move_mech': move_mech,
+            'grid': grid_type,
+            'to_rise': to_rise,
+            'head_serial': head_serial,
+            'area': chunks[b'AREA'],
+            'boa': unpack_array('i', chunks[b'BODY']),
+            'moves': unpack_array('b', chunks[b'MOVE']),
+            'turn_cells': unpack_array('i', chunks[b'TCEL']),
+            'turn_moves': unpack_array('b', chunks[b'TMOV']),
+            'free_empty': unpack_array('i', chunks[b'FREE']) if b'FREE' in chunks else None,
+            'free_eats': unpack_array('i', chunks[b'FEAT']) if b'FEAT' in chunks else None,
+            'rng': _unpack_rng(chunks[b'RAND']) if b'RAND' in chunks else None,
+            'barrier_mech': struct.unpack('<b', chunks[b'BARR'])[0] if b'BARR' in chunks else
+            config.BARRIER_MECH_LINES
+        }
+
+        return header, engine.Engine.from_snapshot(data, grid=grid)
+    except (KeyError, ValueError, struct.error) as e:
+        # нет нужного блока, битый JSON или блок не той длины
+        raise Exception('Файл поврежден!') from e
+    finally:
+        # буфер может быть отображенным в память файлом: до его закрытия не должно остаться ссылок на его память
+        chunks.clear()
+        data = None
+
+
+def read_chunks(buf, magic=MAGIC, max_version=VERSION):
+    """ разбор блоков файла: {тег: memoryview данных} """
+    return dict(iter_chunks(buf, magic, max_version))
+
+
+def iter_chunks(buf, magic=MAGIC, max_version=VERSION):
+    """ блоки файла по порядку: (тег, memoryview данных), теги могут повторяться """
+    buf = memoryview(buf)
+
+    if bytes(buf[:len(magic)]) != magic:
+        raise Exception('Неизвестный формат файла!')
+
+    version, = struct.unpack_from('<H', buf, len(magic))
+
+    if version > max_version:
+        raise Exception(f'Файл сделан более новой версией игры (формат {version})!')
+
+    pos = len(magic) + 2
+
+    while pos < len(buf):
+        if pos + _CHUNK.size > len(buf):
+            raise Exception('Файл поврежден!')
+
+        tag, size = _CHUNK.unpack_from(buf, pos)
+        pos += _CHUNK.size
+
+        if pos + size > len(buf):
+            raise Exception('Файл поврежден!')
+
+        yield tag, buf[pos:pos + size]
+        pos += size
+
+
+def load_legacy(raw):
+    """
+    Сохранение старого формата: длина заголовка, JSON-заголовок, pickle движка.
+    Длина заголовка писалась переменным кол-вом байт (utils.int_to_bytes), а читалась одним байтом
+    (utils.int_size), так что заголовки от 256 байт раньше не читались. Здесь перебираем ширину поля длины
+    """
+
+    import pickle
+
+    for width in range(1, 5):
+        size = utils.int_from_bytes(raw[:width])
+
+        if raw[width:width + 1] != b'{' or width + size > len(raw):
+            continue
+
+        try:
+            header = json.loads(raw[width:width + size].decode('utf-8'))
+        except ValueError:
+            continue
+
+        return header, pickle.loads(raw[width + size:])
+
+    raise Exception('Неизвестный формат файла сохранения!')
+
+
+def write_chunk(f, tag, data):
+    f.write(_CHUNK.pack(tag, len(data)))
+    f.write(data)
+
+
+def pack_array(arr):
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+
+    return arr.tobytes()
+
+
+def unpack_array(typecode, data):
+    arr = array.array(typecode)
+    arr.frombytes(data)
+
+    if sys.byteorder == 'big':
+        arr.byteswap()
+
+    return arr
+
+
+def _pack_rng(state):
+    version, internal, gauss_next = state
+    return _RAND.pack(version, gauss_next is not None, gauss_next or 0.0) + pack_array(array.array('I', internal))
+
+
+def _unpack_rng(data):
+    version, has_gauss, gauss_next = _RAND.unpack_from(data)
+    return version, tuple(unpack_array('I', data[_RAND.size:])), gauss_next if has_gauss else None
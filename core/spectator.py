@@ -0,0 +1,327 @@
+"""
+Трансляция игры зрителям по сети (asyncio, TCP), в том числе игр без окна (--headless) и арены.
+
+Сервер раз в config.SpectatorInterval мс забирает изменения поля из своей ленты (Engine.subscribe) и рассылает
+их всем зрителям одним и тем же кадром: кадр кодируется один раз на всех, сколько бы зрителей ни было. Много
+шагов игры между рассылками (ускоренная игра, --headless) сливаются в один кадр. Поток: сигнатура MAGIC,
+версия (uint16), далее кадры: тип (uint8), длина данных (uint32), данные. Числа - little-endian.
+
+    FRAME_KEY   - ключевой кадр: номер кадра (uint64), высота, ширина (uint32), поле по байту на клетку
+                  построчно, сжатое zlib. Приходит первым после подключения
+    FRAME_DELTA - изменения: номер кадра (uint64), кол-во клеток (uint32), номера клеток (uint32), их типы (uint8)
+
+Медленные зрители не тормозят ни игру, ни других: в сокет пишется без ожидания, а если у зрителя в буфере
+отправки накопилось больше config.SpectatorMaxBuffer байт, изменения ему не шлются. Когда буфер разойдется,
+он получит свежий ключевой кадр, а если не разошелся за config.SpectatorDropTimeout секунд - отключается.
+
+Зритель (Viewer) держит у себя копию поля и собирает ее из кадров, игру он не считает.
+"""
+
+import sys
+import time
+import zlib
+import array
+import struct
+import asyncio
+import threading
+
+from . import savefile, config
+
+MAGIC = b'SNAKESPC'
+VERSION = 1
+
+FRAME_KEY = 1
+FRAME_DELTA = 2
+
+_FRAME = struct.Struct('<BI')
+_KEY = struct.Struct('<QII')
+_DELTA = struct.Struct('<QI')
+
+# поле текстом (Viewer.render)
+_CHARS = dict.fromkeys(config.AreaTypes[config.FIELD_GROUP_EATS], '*')
+_CHARS.update({
+    config.FIELD_TYPE_NONE: '.',
+    config.FIELD_TYPE_HEAD: '@',
+    config.FIELD_TYPE_BODY: 'o',
+    config.FIELD_TYPE_HOLE: 'O',
+    config.FIELD_TYPE_ROCK: '#'
+})
+
+
+def _frame(frame_type, payload):
+    return _FRAME.pack(frame_type, len(payload)) + payload
+
+
+class _Client(object):
+    """ Подключенный зритель на сервере """
+
+    __slots__ = ('writer', 'need_key', 'stale_since')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.need_key = True
+        # с какого времени зритель не успевает принимать кадры (None - успевает)
+        self.stale_since = None
+
+
+class SpectatorServer(object):
+    """
+    Сервер трансляции игры game. Работает в своем потоке с циклом asyncio (start/stop), игру можно менять на
+    ходу (attach) из любого потока - зрители получат новое поле ключевым кадром
+    """
+
+    def __init__(self, game=None, host=config.SpectatorHost, port=config.SpectatorPort,
+                 interval=config.SpectatorInterval):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self._next_game = game
+        self._game = None
+        self._feed = None
+        self._seq = 0
+        self._clients = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+
+    def attach(self, game):
+        """ транслировать игру game (например, после загрузки или новой игры у окна - другой движок) """
+        self._next_game = game
+
+    def viewers(self):
+        return len(self._clients)
+
+    def start(self):
+        """ запустить сервер в фоновом потоке и дождаться, пока он начнет принимать подключения """
+        self._thread = threading.Thread(target=self._run, name='snake-spectator', daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+        if self._error is not None:
+            raise self._error
+
+        print(f'Spectator server: {self.host}:{self.port}')
+
+    def stop(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(config.SaveWaitTimeout)
+            self._thread = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+
+        try:
+            self._loop.run_until_complete(self._listen())
+        except Exception as e:
+            self._error = e
+            self._loop.close()
+            self._loop = None
+            self._started.set()
+            return
+
+        self._started.set()
+        pump = self._loop.create_task(self._pump())
+
+        try:
+            self._loop.run_forever()
+        finally:
+            pump.cancel()
+            self._server.close()
+
+            # закрытие сокетов завершит и задачи зрителей. Недоотправленное не ждем
+            for client in list(self._clients):
+                client.writer.transport.abort()
+
+            self._loop.run_until_complete(asyncio.wait(asyncio.all_tasks(self._loop), timeout=1))
+            self._loop.close()
+
+    async def _listen(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # порт 0 - любой свободный
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, reader, writer):
+        if len(self._clients) >= config.SpectatorMaxViewers:
+            writer.close()
+            return
+
+        client = _Client(writer)
+        writer.write(MAGIC + struct.pack('<H', VERSION))
+        self._clients.add(client)
+
+        try:
+            # зритель ничего не присылает, ждем, пока он отключится
+            while await reader.read(1024):
+                pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    async def _pump(self):
+        while True:
+            await asyncio.sleep(self.interval / 1000)
+
+            try:
+                self._publish()
+            except Exception as e:
+                print(f'{e}')
+
+    def _publish(self):
+        """ разослать зрителям изменения поля с прошлого раза """
+        game = self._next_game
+
+        if game is not self._game:
+            if self._game is not None:
+                with self._game.locked():
+                    self._game.unsubscribe(self._feed)
+
+            self._game = game
+            self._feed = None
+
+            if game is not None:
+                with game.locked():
+                    self._feed = game.subscribe()
+
+        if game is None:
+            return
+
+        now = time.monotonic()
+        ready = []
+
+        for client in list(self._clients):
+            if client.writer.transport.get_write_buffer_size() <= config.SpectatorMaxBuffer:
+                client.stale_since = None
+                ready.append(client)
+            elif client.stale_since is None:
+                client.stale_since = now
+                client.need_key = True
+            elif now - client.stale_since > config.SpectatorDropTimeout:
+                self._clients.discard(client)
+                client.writer.transport.abort()
+
+        if not ready:
+            # изменения все равно забираем, чтобы лента не копилась
+            with game.locked():
+                cells, _ = self._feed.pop()
+
+            if cells is None:
+                for client in self._clients:
+                    client.need_key = True
+
+            return
+
+        need_key = any(client.need_key for client in ready)
+
+        with game.locked():
+            cells, _ = self._feed.pop()
+            h, w = game.size()
+            area = game.area_bytes() if need_key or cells is None else None
+            changed = sorted(top * w + left for top, left in cells) if cells else []
+            types = bytes(game.cell(cell // w, cell % w) for cell in changed)
+
+        self._seq += 1
+        key = delta = None
+
+        if area is not None:
+            key = _frame(FRAME_KEY, _KEY.pack(self._seq, h, w) + zlib.compress(area, 1))
+        if cells is not None and changed:
+            delta = _frame(FRAME_DELTA, _DELTA.pack(self._seq, len(changed)) +
+                           savefile.pack_array(array.array('I', changed)) + types)
+
+        for client in ready:
+            if client.need_key or cells is None:
+                client.writer.write(key)
+                client.need_key = False
+            elif delta is not None:
+                client.writer.write(delta)
+
+
+class Viewer(object):
+    """ Зритель: копия поля транслируемой игры, собранная из кадров сервера """
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.board = bytearray()
+        self.seq = 0
+        self.keyframes = 0
+        self.deltas = 0
+        self._reader = None
+        self._writer = None
+
+    async def connect(self, host=config.SpectatorHost, port=config.SpectatorPort):
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        header = await self._reader.readexactly(len(MAGIC) + 2)
+
+        if header[:len(MAGIC)] != MAGIC:
+            raise Exception('Это не трансляция игры!')
+
+        version, = struct.unpack_from('<H', header, len(MAGIC))
+
+        if version > VERSION:
+            raise Exception(f'Трансляция более новой версии игры (формат {version})!')
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def read_frame(self):
+        """ принять кадр и применить к полю. :return: тип кадра, None - сервер отключился """
+        try:
+            frame_type, size = _FRAME.unpack(await self._reader.readexactly(_FRAME.size))
+            payload = await self._reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return None
+
+        if frame_type == FRAME_KEY:
+            self.seq, self.height, self.width = _KEY.unpack_from(payload)
+            self.board = bytearray(zlib.decompress(payload[_KEY.size:]))
+            self.keyframes += 1
+        elif frame_type == FRAME_DELTA:
+            self.seq, n = _DELTA.unpack_from(payload)
+            cells = savefile.unpack_array('I', payload[_DELTA.size:_DELTA.size + n * 4])
+            types = payload[_DELTA.size + n * 4:]
+
+            for cell, cell_type in zip(cells, types):
+                self.board[cell] = cell_type
+
+            self.deltas += 1
+
+        return frame_type
+
+    def cell(self, top, left):
+        return self.board[top * self.width + left]
+
+    def render(self):
+        """ поле текстом, строка на ряд клеток """
+        return '\n'.join(''.join(_CHARS.get(cell_type, '?') for cell_type in self.board[row:row + self.width])
+                         for row in range(0, len(self.board), self.width))
+
+
+def watch(host=config.SpectatorHost, port=config.SpectatorPort, frames=None):
+    """ смотреть трансляцию в консоли: поле текстом после каждого кадра, frames - сколько кадров (None - все) """
+
+    async def run():
+        viewer = Viewer()
+        await viewer.connect(host, port)
+        n = 0
+
+        try:
+            while frames is None or n < frames:
+                if await viewer.read_frame() is None:
+                    break
+
+                n += 1
+                sys.stdout.write(f'\x1b[H\x1b[2J{viewer.render()}\n'
+                                 f'frame: {viewer.seq}  keyframes: {viewer.keyframes}  deltas: {viewer.deltas}\n')
+                sys.stdout.flush()
+        finally:
+            viewer.close()
+
+    asyncio.run(run())
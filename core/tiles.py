@@ -0,0 +1,71 @@
+import collections
+
+from PyQt5.QtGui import QPixmap, QPainter, QColor
+
+from . import config
+
+
+class TileCache(object):
+    """
+    Кэш заранее отрисованных клеток поля для текущего масштаба.
+    Ключ тайла - цвет (0xRRGGBB) и наличие объемной рамки. Цветов у тела удавчика может быть сколько угодно,
+    поэтому давно не использованные тайлы вытесняются (LRU)
+    """
+
+    def __init__(self, max_tiles=None):
+        self.width = 0
+        self.height = 0
+        self._max_tiles = max_tiles or config.TileCacheSize
+        self._tiles = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def invalidate(self):
+        self._tiles.clear()
+
+    def resize(self, width, height):
+        """ задать размер клетки в пикселях, при изменении размера все тайлы сбрасываются """
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.invalidate()
+
+    def tile(self, rgb, bevel=True):
+        key = (rgb, bevel)
+        pixmap = self._tiles.get(key)
+
+        if pixmap is None:
+            pixmap = self._render(rgb, bevel)
+            self._tiles[key] = pixmap
+
+            if len(self._tiles) > self._max_tiles:
+                self._tiles.popitem(last=False)
+        else:
+            self._tiles.move_to_end(key)
+
+        return pixmap
+
+    def _render(self, rgb, bevel):
+        w, h = self.width, self.height
+        color = QColor(rgb)
+        pixmap = QPixmap(w, h)
+        painter = QPainter(pixmap)
+
+        try:
+            if not bevel:
+                painter.fillRect(0, 0, w, h, color)
+                return pixmap
+
+            painter.fillRect(1, 1, w - 2, h - 2, color)
+
+            painter.setPen(color.lighter())
+            painter.drawLine(0, h - 1, 0, 0)
+            painter.drawLine(0, 0, w - 1, 0)
+
+            painter.setPen(color.darker(150))
+            painter.drawLine(1, h - 1, w - 1, h - 1)
+            painter.drawLine(w - 1, h - 1, w - 1, 1)
+        finally:
+            painter.end()
+
+        return pixmap
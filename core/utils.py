@@ -1,4 +1,5 @@
 import  os
+import contextlib
 
 
 def int_size():
@@ -29,3 +30,25 @@ def get_save_dir():
         os.makedirs(_dir, exist_ok=True)
 
     return _dir
+
+
+@contextlib.contextmanager
+def atomic_write(file_name):
+    """
+    Запись файла целиком или никак: пишем во временный файл рядом, сбрасываем на диск и подменяем им старый.
+    При ошибке внутри блока старый файл остается как был
+    """
+
+    tmp_name = file_name + '.tmp'
+
+    try:
+        with open(tmp_name, 'wb') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+    os.replace(tmp_name, file_name)
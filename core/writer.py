@@ -0,0 +1,58 @@
+"""
+Фоновая запись файлов (сохранения, снимки журнала автосохранения), чтобы игра не подвисала на время записи.
+
+Задания выполняются одним потоком строго по очереди, так что запись и последующее удаление или перезапись
+того же файла не перепутаются. Поток - служебный (daemon): на выходе из программы ждать его незачем дольше, чем
+wait() с ограничением по времени, а недописанный файл все равно не испортит старый (utils.atomic_write).
+"""
+
+import queue
+import threading
+
+
+class Writer(object):
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pending = 0
+        self._done = threading.Condition()
+
+    def submit(self, func, *args):
+        """ выполнить func(*args) в фоне, после всех уже поставленных заданий """
+        with self._done:
+            self._pending += 1
+
+        self._queue.put((func, args))
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='snake-writer', daemon=True)
+            self._thread.start()
+
+    def pending(self):
+        """ сколько заданий еще не выполнено (вместе с выполняемым) """
+        with self._done:
+            return self._pending
+
+    def wait(self, timeout=None):
+        """
+        Подождать выполнения всех поставленных заданий, но не дольше timeout секунд
+
+        :return: bool: все выполнено
+        """
+
+        with self._done:
+            return self._done.wait_for(lambda: self._pending == 0, timeout)
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+
+            try:
+                func(*args)
+            except Exception as e:
+                print(f'{e}')
+            finally:
+                with self._done:
+                    self._pending -= 1
+                    self._done.notify_all()
@@ -1,8 +1,38 @@
 import sys
+import time
 import argparse
-from PyQt5.QtWidgets import QApplication
 
-from core import game
+# от этого момента считается время запуска для --profile-startup
+STARTED = time.perf_counter()
+
+from core import config
+
+
+def print_profile(file_name):
+    """ замеры времени после прогона без окна: None - замеры не включались """
+    if file_name is None:
+        return
+
+    from core import profiler
+
+    print('')
+    profiler.print_report()
+
+    if file_name:
+        profiler.dump(file_name)
+        print(f'Profile saved to: {file_name}')
+
+
+def start_spectators(port):
+    """ сервер трансляции игры для прогона без окна: None - трансляция не включалась """
+    if port is None:
+        return None
+
+    from core import spectator
+
+    server = spectator.SpectatorServer(port=port)
+    server.start()
+    return server
 
 
 def main():
@@ -14,11 +44,136 @@ def main():
     ap.add_argument('-a', '--arrange_mech', type=int,
                     help='Способ расположения нового удава на поле при старте игры: '
                          '0 - спираль (улитка), 1 - зигзаг. По умолчанию 0')
+    ap.add_argument('-m', '--move_mech', type=int,
+                    help='Способ перемещения удава: 0 - поэлементно (для сравнения), '
+                         '1 - очередью (голова добавляется, хвост снимается). По умолчанию 1')
+    ap.add_argument('-g', '--grid', type=int,
+                    help='Матрица поля: 0 - списки python, 1 - массив numpy (для больших полей). По умолчанию 0')
+    ap.add_argument('--headless', action='store_true',
+                    help='Прогнать движок без окна с максимальной скоростью и вывести статистику производительности')
+    ap.add_argument('--width', type=int, default=config.BoxWidth,
+                    help='Ширина поля. Если поле не влезает в окно, показывается его часть вокруг головы')
+    ap.add_argument('--height', type=int, default=config.BoxHeight, help='Высота поля')
+    ap.add_argument('--ticks', type=int, help='Сколько шагов прогнать (для --headless). По умолчанию 100000')
+    ap.add_argument('--games', type=int, help='Сколько игр прогнать (для --headless)')
+    ap.add_argument('--policy', default='random',
+                    help='Управление удавом (для --headless): random - случайные повороты, '
+                         'script - по сценарию из --script, auto - автопилот')
+    ap.add_argument('--script', help='Сценарий поворотов: символ на шаг, U, D, L, R - повернуть, . - прямо')
+    ap.add_argument('--seed', type=int, help='Начальное значение генератора случайных чисел (для --headless)')
+    ap.add_argument('--workers', type=int,
+                    help='Прогнать --games игр параллельно на заданном кол-ве процессов (для --headless, 0 - по '
+                         'процессу на ядро) и вывести сводную статистику по играм')
+    ap.add_argument('--boas', type=int,
+                    help='Сколько удавчиков на одном поле (для --headless): все ходят одновременно, у каждого - '
+                         'своя стратегия --policy')
+    ap.add_argument('--barriers', type=int, help='Переопределить кол-во проходов расстановки препятствий (для --workers)')
+    ap.add_argument('--eats_interval', type=int,
+                    help='Переопределить интервал появления еды (для --workers и --batch)')
+    ap.add_argument('--batch', type=int,
+                    help='Сверить BatchEngine с Engine (для --headless): столько игр идут и пачкой, и каждая своим '
+                         'движком, с поворотами от --policy')
+    ap.add_argument('--record', help='Записывать игры в файл повтора: первая игра - в этот файл, следующие - рядом, '
+                                     'с номером игры (game.rep, game-2.rep, ...)')
+    ap.add_argument('--replay', nargs='+',
+                    help='Показать запись игры из файла. С --headless - прогнать записи с максимальной скоростью '
+                         'и сверить результат с записанным')
+    ap.add_argument('--rate', type=float, default=1.0, help='Скорость просмотра записи (во сколько раз быстрее игры)')
+    ap.add_argument('--profile', nargs='?', const='',
+                    help='Замерять время шага игры, отрисовки, сохранения и т.п. (вывод - по клавише i и в конце '
+                         '--headless, кроме --workers). Если задан файл - туда пишется JSON с замерами')
+    ap.add_argument('--serve', nargs='?', type=int, const=config.SpectatorPort,
+                    help=f'Транслировать игру зрителям по сети (в т.ч. с --headless, кроме --workers и --replay), '
+                         f'порт - по умолчанию {config.SpectatorPort}. Сервер слушает только {config.SpectatorHost}')
+    ap.add_argument('--watch', nargs='?', const=f'{config.SpectatorHost}:{config.SpectatorPort}',
+                    help='Смотреть трансляцию игры в консоли, адрес - host:port')
+    ap.add_argument('--profile-startup', action='store_true',
+                    help='Вывести, сколько времени прошло от запуска до импорта модулей, первой отрисовки окна и '
+                         'начала игры')
     args = ap.parse_args()
 
+    if args.profile is not None:
+        from core import profiler
+
+        profiler.enable()
+
+    if args.watch:
+        from core import spectator
+
+        host, _, port = args.watch.rpartition(':')
+        spectator.watch(host or config.SpectatorHost, int(port))
+        return
+
+    if args.headless and args.replay:
+        from core import replay
+
+        stats = replay.benchmark(args.replay, grid=args.grid)
+        replay.print_report(stats)
+        print_profile(args.profile)
+
+        if not all(st['ok'] for st in stats):
+            sys.exit(1)
+
+        return
+
+    if args.headless and args.boas:
+        from core import arena
+
+        stats = arena.benchmark(args.width, args.height, args.boas, length=args.length, grid=args.grid,
+                                difficulty=args.difficulty, ticks=args.ticks, policy=args.policy, script=args.script,
+                                seed=args.seed, spectators=start_spectators(args.serve))
+        arena.print_report(stats)
+        print_profile(args.profile)
+        return
+
+    if args.headless and args.batch:
+        from core import batch
+
+        stats = batch.compare(args.batch, args.width, args.height, length=args.length, difficulty=args.difficulty,
+                              eats_interval=args.eats_interval, ticks=args.ticks, policy=args.policy,
+                              script=args.script, seed=args.seed)
+        batch.print_report(stats)
+
+        if stats['mismatched']:
+            sys.exit(1)
+
+        return
+
+    if args.headless and args.workers is not None:
+        from core import runner
+
+        stats = runner.run(args.games or 1000, width=args.width, height=args.height, length=args.length,
+                           arrange_mech=args.arrange_mech, move_mech=args.move_mech, grid=args.grid,
+                           difficulty=args.difficulty, barriers=args.barriers, eats_interval=args.eats_interval,
+                           policy=args.policy, script=args.script, max_ticks=args.ticks or 100000,
+                           seed=args.seed or 0, workers=args.workers)
+        runner.print_report(stats)
+        return
+
+    if args.headless:
+        from core import headless
+
+        stats = headless.benchmark(args.width, args.height, length=args.length, arrange_mech=args.arrange_mech,
+                                   move_mech=args.move_mech, grid=args.grid, difficulty=args.difficulty,
+                                   ticks=args.ticks, games=args.games, seed=args.seed,
+                                   policy=headless.make_policy(args.policy, script=args.script, seed=args.seed),
+                                   spectators=start_spectators(args.serve))
+        headless.print_report(stats)
+        print_profile(args.profile)
+        return
+
+    from PyQt5.QtWidgets import QApplication
+    from core import game
+
+    if args.profile_startup:
+        print(f'Startup: imports: {round((time.perf_counter() - STARTED) * 1000, 1)} ms')
+
     app = QApplication(sys.argv)
     snake = game.Snake(app, difficulty=args.difficulty, length=args.length, arrange_mech=args.arrange_mech,
-                       cheats_on=args.cheats_on)
+                       move_mech=args.move_mech, grid=args.grid, cheats_on=args.cheats_on, record_file=args.record,
+                       replay_file=args.replay[0] if args.replay else None, replay_rate=args.rate,
+                       width=args.width, height=args.height, profile_file=args.profile or None,
+                       startup_time=STARTED if args.profile_startup else None, spectator_port=args.serve)
     sys.exit(app.exec_())
 
 